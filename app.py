@@ -1,7 +1,14 @@
 import streamlit as st
 import os
 from document_processor import DocumentProcessor
-from rag_engine import RAGEngine
+from rag_engine import RAGEngine, source_filter, section_filter, combine_filters, format_citation
+from corpus_manifest import CorpusManifest, corpus_version
+from ingestion_jobs import IngestionQueue
+from instrumentation import metrics
+from section_extractor import SECTION_TYPES
+from config import (
+    CHROMA_DB_DIR, METRICS_JSONL_PATH, METRICS_PROMETHEUS_PATH, EXTRACTION_MODE, DROPPED_SECTIONS
+)
 
 # Configure page
 st.set_page_config(
@@ -17,6 +24,122 @@ def init_components():
 
 doc_processor, rag_engine = init_components()
 
+@st.cache_resource(max_entries=2)
+def load_shared_vectorstore(version):
+    """Read-only vector store for one corpus version, shared by every session
+
+    Sessions hold no store of their own: each run looks up the current
+    corpus version, so a version published by ingestion is loaded once for
+    everyone, and the previous one is dropped after the next publish.
+    """
+    return rag_engine.load_vector_store(CHROMA_DB_DIR)
+
+def current_vectorstore():
+    if not os.path.exists(CHROMA_DB_DIR):
+        return None
+    return load_shared_vectorstore(corpus_version(CHROMA_DB_DIR))
+
+@st.cache_resource
+def init_ingestion_queue():
+    """One ingestion worker pool per server process, shared by every session"""
+    return IngestionQueue(doc_processor)
+
+ingestion_queue = init_ingestion_queue()
+
+def show_ingest_jobs(active):
+    """Progress, cancel/resume controls and per-file results of this session's jobs"""
+    for job_id in st.session_state['ingest_jobs'][:5]:
+        job = ingestion_queue.status(job_id)
+        if job is None:
+            continue
+        total = len(job["files"])
+        st.progress(
+            job["written"] / total if total else 1.0,
+            text=(
+                f"{job['status'].title()}: {job['written']}/{total} files written, "
+                f"{job['done']} published"
+            )
+        )
+        if job["status"] in ("queued", "running"):
+            if st.button("Cancel", key=f"cancel-{job_id}"):
+                ingestion_queue.cancel(job_id)
+        elif job["status"] in ("failed", "cancelled"):
+            if st.button("Resume", key=f"resume-{job_id}"):
+                ingestion_queue.resume(job_id)
+                st.rerun()
+        if job["error"]:
+            st.error(job["error"])
+        with st.expander("📄 Files"):
+            for file in job["files"]:
+                line = f"{file['name']}: {file['status']}"
+                if file["seconds"] is not None:
+                    line += f" in {file['seconds']:.2f}s"
+                st.write(line)
+                stats = file["stats"]
+                if stats:
+                    caption = (
+                        f"Chunks: {stats['added']} added, {stats['skipped']} unchanged, "
+                        f"{stats['deleted']} removed"
+                    )
+                    if "cache_hits" in stats:
+                        # Cache figures cover the file's whole batch
+                        caption += (
+                            f" | Embedding cache: {stats['cache_hits']} hits, {stats['cache_misses']} misses"
+                        )
+                        if stats.get("batch_files", 1) > 1:
+                            caption += f" (batch of {stats['batch_files']} files)"
+                    st.caption(caption)
+                    if stats.get("summary_error"):
+                        st.caption(
+                            f"Paper summary deferred to the first analysis: {stats['summary_error']}"
+                        )
+                if file["error"]:
+                    st.error(file["error"])
+
+    # A job finished since the last poll: rerun the whole page so the document
+    # list and the shared vector store pick up the new corpus version
+    if any(
+        ingestion_queue.status(job_id)["status"] not in ("queued", "running")
+        for job_id in active
+    ):
+        st.rerun()
+
+def show_metrics():
+    """Stage timings, counters and estimated cost for this server process"""
+    if not metrics.enabled:
+        st.caption("Instrumentation is disabled (INSTRUMENTATION=false).")
+        return
+    snapshot = metrics.snapshot()
+    if not snapshot["spans"] and not snapshot["counters"]:
+        st.caption("No ingestion or queries yet.")
+        return
+    st.dataframe(
+        [
+            {
+                "Stage": name,
+                "Calls": stats["count"],
+                "Total (s)": round(stats["total_seconds"], 2),
+                "Mean (ms)": round(stats["mean_seconds"] * 1000, 1),
+                "p95 (ms)": round(stats["p95_seconds"] * 1000, 1)
+            }
+            for name, stats in snapshot["spans"].items()
+        ],
+        hide_index=True
+    )
+    counters = snapshot["counters"]
+    st.caption(" · ".join(f"{name.replace('_', ' ')}: {value:,}" for name, value in counters.items()))
+    st.metric("Estimated API cost", f"${snapshot['cost_usd']:.4f}")
+    col_jsonl, col_prom, col_reset = st.columns(3)
+    if col_jsonl.button("JSONL", help=f"Append a snapshot to {METRICS_JSONL_PATH}"):
+        metrics.export_jsonl(METRICS_JSONL_PATH)
+        st.toast(f"Appended to {METRICS_JSONL_PATH}")
+    if col_prom.button("Prometheus", help=f"Write {METRICS_PROMETHEUS_PATH}"):
+        metrics.export_prometheus(METRICS_PROMETHEUS_PATH)
+        st.toast(f"Wrote {METRICS_PROMETHEUS_PATH}")
+    if col_reset.button("Reset"):
+        metrics.reset()
+        st.rerun()
+
 # Main UI
 st.title("🔬 Research Synthesis Tool with Academic Writing Assistant")
 st.markdown("**Upload research papers and get intelligent synthesis with multiple writing styles!**")
@@ -31,20 +154,28 @@ with st.sidebar:
     )
     
     if uploaded_files:
+        low_memory = st.checkbox(
+            "Low-memory streaming ingestion",
+            help="Embed page by page in small batches instead of extracting everything first"
+        )
         if st.button("Process Documents"):
-            with st.spinner("Processing documents..."):
-                try:
-                    all_text = ""
-                    for file in uploaded_files:
-                        text = doc_processor.process_pdf(file)
-                        all_text += f"\n\nDocument: {file.name}\n{text}"
-                    
-                    # Create vector store
-                    vectorstore = doc_processor.create_vector_store(all_text)
-                    st.session_state['vectorstore'] = vectorstore
-                    st.success(f"Processed {len(uploaded_files)} documents!")
-                except Exception as e:
-                    st.error(f"Error processing documents: {e}")
+            # Ingestion runs on the shared worker pool; this run only saves the uploads
+            job_id = ingestion_queue.submit(
+                [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files],
+                low_memory=low_memory
+            )
+            st.session_state.setdefault('ingest_jobs', []).insert(0, job_id)
+
+    if st.session_state.get('ingest_jobs'):
+        active = [
+            job_id for job_id in st.session_state['ingest_jobs']
+            if (ingestion_queue.status(job_id) or {}).get("status") in ("queued", "running")
+        ]
+        # Poll only while this session has work in flight
+        st.fragment(run_every=2 if active else None)(show_ingest_jobs)(active)
+
+    with st.expander("📈 Pipeline Metrics"):
+        show_metrics()
 
 # Main content area
 col1, col2 = st.columns([1, 1])
@@ -56,14 +187,33 @@ with col1:
         height=100,
         placeholder="What are the main findings about climate change impacts on agriculture?"
     )
+    scoped_sources = st.multiselect(
+        "Limit to documents (optional):",
+        sorted(CorpusManifest(CHROMA_DB_DIR).documents)
+    )
+    scoped_sections = []
+    if EXTRACTION_MODE == "sections":
+        # e.g. only "methods" chunks when comparing methodologies
+        scoped_sections = st.multiselect(
+            "Limit to sections (optional):",
+            [kind for kind in SECTION_TYPES if kind not in DROPPED_SECTIONS],
+            format_func=lambda kind: kind.replace("_", " ").title()
+        )
     
+    # Tokens are rendered below as they arrive, so only retrieval blocks here
+    streaming_response = None
     if st.button("Generate Synthesis"):
-        if 'vectorstore' in st.session_state and query:
-            with st.spinner("Generating research synthesis..."):
+        vectorstore = current_vectorstore()
+        if vectorstore is not None and query:
+            with st.spinner("Retrieving relevant passages..."):
                 try:
-                    response = rag_engine.query_documents(query, st.session_state['vectorstore'])
-                    st.session_state['synthesis'] = response['result']
-                    st.session_state['sources'] = response.get('source_documents', [])
+                    streaming_response = rag_engine.query_documents(
+                        query, vectorstore, stream=True,
+                        filter=combine_filters(
+                            source_filter(scoped_sources), section_filter(scoped_sections)
+                        )
+                    )
+                    st.session_state['sources'] = streaming_response['source_documents']
                 except Exception as e:
                     st.error(f"Error generating synthesis: {e}")
         else:
@@ -71,6 +221,7 @@ with col1:
 
 with col2:
     st.header("✍️ Academic Writing Assistant")
+    streaming_transform = None
     
     if 'synthesis' in st.session_state:
         writing_style = st.selectbox(
@@ -85,26 +236,47 @@ with col2:
         )
         
         if st.button("Transform Writing Style"):
-            with st.spinner("Transforming writing style..."):
-                try:
-                    transformed = rag_engine.academic_writing_assistant(
-                        st.session_state['synthesis'], 
-                        writing_style
-                    )
-                    st.session_state['transformed'] = transformed
-                except Exception as e:
-                    st.error(f"Error transforming text: {e}")
+            streaming_transform = rag_engine.academic_writing_assistant(
+                st.session_state['synthesis'], 
+                writing_style,
+                stream=True
+            )
 
 # Display results
-if 'synthesis' in st.session_state:
+if streaming_response is not None:
+    st.header("📊 Research Synthesis")
+    try:
+        st.session_state['synthesis'] = st.write_stream(streaming_response['result_stream'])
+        st.session_state['timings'] = streaming_response['timings']
+        st.session_state['cached_query'] = streaming_response.get('cached_query')
+        # Rerun so the writing assistant picks up the finished synthesis
+        st.rerun()
+    except Exception as e:
+        st.error(f"Error generating synthesis: {e}")
+
+if 'synthesis' in st.session_state and streaming_response is None:
     st.header("📊 Research Synthesis")
     st.write(st.session_state['synthesis'])
+    if st.session_state.get('cached_query'):
+        st.caption(f"♻️ Reused the answer to a similar question: \"{st.session_state['cached_query']}\"")
+    timings = st.session_state.get('timings')
+    if timings:
+        st.caption(
+            f"Retrieval {timings['retrieval']:.2f}s · Prompt {timings['prompt']:.3f}s · "
+            f"LLM {timings['llm']:.2f}s · Total {timings['total']:.2f}s"
+        )
     
-    if 'transformed' in st.session_state:
+    if streaming_transform is not None:
+        st.header("✨ Transformed Output")
+        try:
+            st.session_state['transformed'] = st.write_stream(streaming_transform)
+        except Exception as e:
+            st.error(f"Error transforming text: {e}")
+    elif 'transformed' in st.session_state:
         st.header("✨ Transformed Output")
         st.write(st.session_state['transformed'])
     
     with st.expander("📚 Source Documents"):
         for i, doc in enumerate(st.session_state.get('sources', [])):
-            st.write(f"**Source {i+1}:**")
+            st.write(f"**Source {i+1}:** {format_citation(doc)}")
             st.write(doc.page_content[:500] + "...")
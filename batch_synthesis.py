@@ -0,0 +1,139 @@
+"""Headless bulk synthesis over a persisted vector store.
+
+Reads one JSON object per line, answers each query through RAGEngine with
+bounded concurrency, and writes a result line as soon as each query finishes:
+
+    python batch_synthesis.py queries.jsonl -o results.jsonl --concurrency 8
+
+Each input line needs a "query" (or "question"/"body") field and may carry an
+"id" (or "request_id"); the line number is used otherwise. Throughput and
+p50/p95 latency are printed when the run completes.
+"""
+import argparse
+import json
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import CHROMA_DB_DIR
+
+
+def read_queries(path):
+    """Yield (id, query) pairs from a JSONL file, skipping blank lines"""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            query = record.get("query") or record.get("question") or record.get("body")
+            if not query:
+                raise ValueError(f"{path}:{line_number} has no query field")
+            yield record.get("id") or record.get("request_id") or line_number, query
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def run_batch(rag_engine, vectorstore, queries, output, concurrency=4, num_docs=3):
+    """Answer queries concurrently, writing each result line as it completes
+
+    Returns a summary dict with counts, wall time, throughput and latencies.
+    """
+    latencies = []
+    failures = 0
+    started = time.perf_counter()
+
+    def answer(query_id, query):
+        began = time.perf_counter()
+        try:
+            response = rag_engine.query_documents(query, vectorstore, num_docs=num_docs)
+            record = {
+                "id": query_id,
+                "query": query,
+                "result": response["result"],
+                "cached": "cached_query" in response,
+                "sources": [
+                    {
+                        "source": doc.metadata.get("source"),
+                        "page": doc.metadata.get("page"),
+                        "start_index": doc.metadata.get("start_index"),
+                        "end_index": doc.metadata.get("end_index"),
+                        "excerpt": doc.page_content[:200]
+                    }
+                    for doc in response.get("source_documents", [])
+                ]
+            }
+        except Exception as e:
+            record = {"id": query_id, "query": query, "error": str(e)}
+        record["latency"] = time.perf_counter() - began
+        return record
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(answer, query_id, query) for query_id, query in queries]
+        for future in as_completed(futures):
+            record = future.result()
+            if "error" in record:
+                failures += 1
+            else:
+                latencies.append(record["latency"])
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+
+    elapsed = time.perf_counter() - started
+    completed = len(latencies) + failures
+    return {
+        "queries": completed,
+        "failed": failures,
+        "seconds": elapsed,
+        "throughput_qps": completed / elapsed if elapsed else 0.0,
+        "p50_latency": percentile(latencies, 50),
+        "p95_latency": percentile(latencies, 95)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="JSONL file of queries")
+    parser.add_argument("-o", "--output", default="-", help="JSONL results file (default: stdout)")
+    parser.add_argument("--persist-directory", default=CHROMA_DB_DIR)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--num-docs", type=int, default=3)
+    args = parser.parse_args()
+
+    from rag_engine import RAGEngine
+
+    rag_engine = RAGEngine()
+    vectorstore = rag_engine.load_vector_store(args.persist_directory)
+    if vectorstore is None:
+        parser.error(f"No vector store found at {args.persist_directory}")
+
+    queries = list(read_queries(args.input))
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        summary = run_batch(
+            rag_engine, vectorstore, queries, output,
+            concurrency=args.concurrency, num_docs=args.num_docs
+        )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(
+        f"{summary['queries']} queries ({summary['failed']} failed) in {summary['seconds']:.1f}s | "
+        f"{summary['throughput_qps']:.2f} q/s | p50 {summary['p50_latency']:.2f}s | "
+        f"p95 {summary['p95_latency']:.2f}s",
+        file=sys.stderr
+    )
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
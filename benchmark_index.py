@@ -0,0 +1,184 @@
+"""Recall and memory benchmark of the quantized index against Chroma.
+
+Builds a QuantizedIndex from a Chroma collection and answers the same
+queries with both, reporting recall@k against exact search and against
+Chroma's results, latency and the memory each index keeps resident
+(Chroma's is estimated from its HNSW layout):
+
+    python benchmark_index.py --persist-directory ./data/chroma_db --k 10
+    python benchmark_index.py --synthetic 200000 --dimensions 384
+
+Queries are stored vectors with a little noise added. --synthetic fills a
+temporary Chroma store with clustered random unit vectors instead of using
+a real corpus. The exit status is 1 when recall against Chroma falls below
+--min-recall.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from config import CHROMA_DB_DIR, QUANTIZED_IVF_LISTS, QUANTIZED_IVF_NPROBE
+from batch_synthesis import percentile
+
+
+def synthetic_collection(directory, count, dimensions, clusters=200, seed=0, batch_size=5000):
+    """Chroma collection of clustered random unit vectors (like real embeddings)"""
+    import chromadb
+
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions)).astype(np.float32)
+    client = chromadb.PersistentClient(path=directory)
+    collection = client.get_or_create_collection("benchmark")
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        vectors = centers[rng.integers(clusters, size=size)] + rng.normal(
+            scale=0.6, size=(size, dimensions)
+        ).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        collection.add(
+            ids=[f"chunk-{i}" for i in range(start, start + size)],
+            embeddings=vectors
+        )
+    return collection
+
+
+def chroma_memory_estimate(collection, count, dimensions):
+    """Resident bytes of Chroma's HNSW index: float32 vectors, level-0 links, labels"""
+    configuration = getattr(collection, "configuration", None) or {}
+    max_neighbors = (configuration.get("hnsw") or {}).get("max_neighbors", 16)
+    return count * (dimensions * 4 + 2 * max_neighbors * 4 + 8)
+
+
+def float32_copy(collection, path, batch_size=5000):
+    """Chroma's own float32 vectors, streamed into a memory-mapped file, and their IDs
+
+    The quantized index re-ranks against float16 copies, so exact search
+    reads the vectors Chroma stores instead.
+    """
+    count = collection.count()
+    ids, vectors = [], None
+    for offset in range(0, count, batch_size):
+        batch = collection.get(include=["embeddings"], limit=batch_size, offset=offset)
+        embeddings = np.asarray(batch["embeddings"], dtype=np.float32)
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(
+                path, mode="w+", dtype=np.float32, shape=(count, embeddings.shape[1])
+            )
+        vectors[offset:offset + len(embeddings)] = embeddings
+        ids.extend(batch["ids"])
+    vectors.flush()
+    return np.array(ids), vectors
+
+
+def sample_queries(vectors, count, noise=0.05, seed=1):
+    rng = np.random.default_rng(seed)
+    rows = np.asarray(vectors[np.sort(rng.choice(len(vectors), count, replace=False))])
+    queries = rows + rng.normal(scale=noise, size=rows.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def exact_neighbours(ids, vectors, query, k, space, block_rows=65536):
+    """Ground truth by exhaustive float32 search, read block by block"""
+    from quantized_index import _exact_distances
+
+    best_ids, best_distances = [], []
+    for start in range(0, len(vectors), block_rows):
+        block = np.asarray(vectors[start:start + block_rows])
+        distances = _exact_distances(block, query, space)
+        top = np.argsort(distances)[:k]
+        best_ids.append(top + start)
+        best_distances.append(distances[top])
+    positions = np.concatenate(best_ids)
+    return set(ids[positions[np.argsort(np.concatenate(best_distances))[:k]]].tolist())
+
+
+def run_benchmark(collection, index, exact, queries, k, nprobe=QUANTIZED_IVF_NPROBE):
+    """Recall@k and latency of Chroma and the quantized index for each query
+
+    exact is the (ids, vectors) pair from float32_copy.
+    """
+    results = {"chroma": [], "quantized": []}
+    recall = {"chroma": [], "quantized": [], "quantized_vs_chroma": []}
+    for query in queries:
+        truth = exact_neighbours(*exact, query, k, index.space)
+
+        began = time.perf_counter()
+        chroma_ids = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])["ids"][0]
+        results["chroma"].append(time.perf_counter() - began)
+
+        began = time.perf_counter()
+        positions, _ = index.search(query, k, nprobe=nprobe)
+        results["quantized"].append(time.perf_counter() - began)
+        quantized_ids = index.id_at(positions)
+
+        recall["chroma"].append(len(truth & set(chroma_ids)) / k)
+        recall["quantized"].append(len(truth & set(quantized_ids)) / k)
+        recall["quantized_vs_chroma"].append(len(set(chroma_ids) & set(quantized_ids)) / k)
+
+    return {
+        **{f"recall_{name}": float(np.mean(values)) for name, values in recall.items()},
+        **{f"p50_{name}_ms": percentile(values, 50) * 1000 for name, values in results.items()},
+        **{f"p95_{name}_ms": percentile(values, 95) * 1000 for name, values in results.items()}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--persist-directory", default=CHROMA_DB_DIR)
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="benchmark N synthetic vectors instead of a stored corpus")
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ivf-lists", default=QUANTIZED_IVF_LISTS)
+    parser.add_argument("--nprobe", type=int, default=QUANTIZED_IVF_NPROBE)
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    args = parser.parse_args()
+
+    from quantized_index import QuantizedIndex
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.synthetic:
+            print(f"Writing {args.synthetic} synthetic vectors to Chroma...", file=sys.stderr)
+            collection = synthetic_collection(
+                os.path.join(workdir, "chroma"), args.synthetic, args.dimensions
+            )
+        else:
+            from langchain_community.vectorstores import Chroma
+
+            if not os.path.exists(args.persist_directory):
+                parser.error(f"No vector store found at {args.persist_directory}")
+            collection = Chroma(persist_directory=args.persist_directory)._collection
+
+        began = time.perf_counter()
+        index = QuantizedIndex.build(collection, os.path.join(workdir, "index"), 0, n_lists=args.ivf_lists)
+        build_seconds = time.perf_counter() - began
+        exact = float32_copy(collection, os.path.join(workdir, "float32.npy"))
+        queries = sample_queries(exact[1], min(args.queries, len(index)))
+
+        summary = run_benchmark(collection, index, exact, queries, args.k, args.nprobe)
+        memory = index.memory_usage()
+        chroma_bytes = chroma_memory_estimate(collection, len(index), index.dimensions)
+        print(
+            f"{len(index)} vectors x {index.dimensions} dims, {index.meta['n_lists']} IVF lists "
+            f"(built in {build_seconds:.1f}s)\n"
+            f"memory: int8 index {memory['index'] / 2**20:.1f} MiB vs float32 "
+            f"{memory['float32'] / 2**20:.1f} MiB "
+            f"({memory['float32'] / max(memory['index'], 1):.1f}x smaller), "
+            f"Chroma HNSW ~{chroma_bytes / 2**20:.1f} MiB "
+            f"({chroma_bytes / max(memory['index'], 1):.1f}x smaller)\n"
+            f"recall@{args.k} vs exact: chroma {summary['recall_chroma']:.3f}, "
+            f"quantized {summary['recall_quantized']:.3f}\n"
+            f"recall@{args.k} vs chroma: quantized {summary['recall_quantized_vs_chroma']:.3f}\n"
+            f"latency p50/p95: chroma {summary['p50_chroma_ms']:.2f}/{summary['p95_chroma_ms']:.2f} ms, "
+            f"quantized {summary['p50_quantized_ms']:.2f}/{summary['p95_quantized_ms']:.2f} ms"
+        )
+    return 1 if summary["recall_quantized_vs_chroma"] < args.min_recall else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+"""Offline end-to-end benchmark of ingestion and querying.
+
+Writes a synthetic corpus of PDFs, ingests it with DocumentProcessor and
+answers queries with RAGEngine. Embeddings come from the deterministic
+"hash" backend and answers from a local echo LLM, and every store lives in
+a scratch directory, so no network access or API key is needed:
+
+    python benchmark_pipeline.py --documents 20 --pages 12 --queries 200
+    python benchmark_pipeline.py --save-baseline benchmark_baseline.json
+
+Reports extraction pages/s, ingestion chunks/s, query p50/p99 latency,
+peak resident memory and the slowest instrumented stages. The results are
+compared with --baseline (benchmark_baseline.json by default, when it
+exists and was recorded with the same corpus settings). The exit status is
+1 when a throughput drops, or a latency or memory figure grows, by more
+than --tolerance.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.llms import LLM
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# Compared against the baseline: True when higher is better
+TRACKED_METRICS = {
+    "pages_per_second": True,
+    "chunks_per_second": True,
+    "query_p50_ms": False,
+    "query_p99_ms": False,
+    "peak_rss_mib": False
+}
+# Settings that must match for a baseline to be comparable
+CORPUS_SETTINGS = ("documents", "pages", "queries", "workers", "seed")
+
+TOPICS = [
+    "crop yield", "soil moisture", "heat stress", "irrigation demand", "drought frequency",
+    "carbon sequestration", "pest pressure", "growing season length", "rainfall variability",
+    "fertilizer efficiency", "groundwater depletion", "market prices"
+]
+WORDS = (
+    "analysis data model effect increase decrease region farm season temperature "
+    "precipitation variance sample survey estimate trend adaptation policy yield "
+    "measurement observation experiment control treatment response significant "
+    "correlation regression scenario projection uncertainty baseline annual average"
+).split()
+SECTIONS = ["Abstract", "1 Introduction", "2 Methods", "3 Results", "4 Discussion", "References"]
+
+
+class EchoLLM(LLM):
+    """Local LLM stand-in: answers with the opening words of the prompt's context"""
+
+    model_name: str = "echo"
+    answer_words: int = 120
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "echo"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None,
+              **kwargs: Any) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return "Synthesis: " + " ".join(prompt.split()[:self.answer_words])
+
+
+def synthetic_paper(rng, pages, lines_per_page=50, line_chars=95):
+    """Pages of a fake paper as lists of text lines, with section headings"""
+    topic, other = rng.sample(TOPICS, 2)
+    headings = {
+        round(i * pages * lines_per_page / len(SECTIONS)): heading
+        for i, heading in enumerate(SECTIONS)
+    }
+    result = []
+    line_number = 0
+    for _ in range(pages):
+        lines = []
+        while len(lines) < lines_per_page:
+            if line_number in headings:
+                lines.append(headings[line_number])
+            else:
+                words = []
+                while sum(len(word) + 1 for word in words) < line_chars:
+                    words.append(rng.choice(WORDS) if rng.random() > 0.1 else rng.choice([topic, other]))
+                # The paragraph before a heading ends a sentence
+                lines.append(" ".join(words) + ("." if line_number + 1 in headings else ""))
+            line_number += 1
+        result.append(lines)
+    return result
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def pdf_bytes(pages):
+    """Minimal uncompressed PDF showing each page's lines in Helvetica"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        stream = (
+            "BT /F1 9 Tf 14 TL 56 760 Td "
+            + " ".join(f"({_escape(line)}) Tj T*" for line in lines)
+            + " ET"
+        ).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append((
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        ).encode("latin-1"))
+        kids.append(len(objects))
+    objects[1] = (
+        f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] /Count {len(kids)} >>"
+    ).encode("latin-1")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def write_corpus(directory, documents, pages, seed=0):
+    """Write `documents` synthetic PDFs of `pages` pages each, returning their paths"""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(documents):
+        path = os.path.join(directory, f"paper_{i + 1:04d}.pdf")
+        with open(path, "wb") as f:
+            f.write(pdf_bytes(synthetic_paper(rng, pages)))
+        paths.append(path)
+    return paths
+
+
+def synthetic_queries(count, seed=1):
+    rng = random.Random(seed)
+    templates = [
+        "How does {a} affect {b}?",
+        "What methods were used to measure {a}?",
+        "What are the main findings about {a} and {b}?",
+        "Which regions report changes in {a}?"
+    ]
+    return [
+        rng.choice(templates).format(a=rng.choice(TOPICS), b=rng.choice(TOPICS))
+        for _ in range(count)
+    ]
+
+
+def peak_rss_mib():
+    """Peak resident memory of this process (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def run_pipeline(workdir, documents, pages, queries, workers, seed=0, llm_latency=0.0):
+    """Ingest a synthetic corpus and query it; returns the measured results"""
+    # The project modules read their settings at import time
+    os.environ["DATA_DIR"] = os.path.join(workdir, "data")
+    os.environ["EMBEDDING_BACKEND"] = "hash"
+    os.environ["SUMMARIZE_ON_INGEST"] = "false"
+    os.environ["INSTRUMENTATION"] = "true"
+    from batch_synthesis import percentile
+    from config import CHROMA_DB_DIR
+    from document_processor import DocumentProcessor
+    from instrumentation import metrics
+    from rag_engine import RAGEngine
+
+    paths = write_corpus(os.path.join(workdir, "pdfs"), documents, pages, seed)
+    processor = DocumentProcessor()
+    engine = RAGEngine(llm=EchoLLM(latency=llm_latency))
+    # Time throughput, not the one-off imports ingestion would otherwise trigger
+    import pypdf  # noqa: F401
+    import langchain_community.vectorstores  # noqa: F401
+    processor.embedding_scheduler
+    processor.text_splitter
+
+    began = time.perf_counter()
+    extracted = processor.extract_pdfs(paths, max_workers=workers)
+    extract_seconds = time.perf_counter() - began
+    total_pages = sum(len(document["pages"]) for document in extracted)
+
+    began = time.perf_counter()
+    processor.ingest_documents(extracted, persist_directory=CHROMA_DB_DIR)
+    ingest_seconds = time.perf_counter() - began
+    chunks = processor.ingest_stats["added"]
+
+    vectorstore = engine.load_vector_store(CHROMA_DB_DIR)
+    questions = synthetic_queries(queries, seed + 1)
+    # The first query pays for lazy imports and client setup
+    engine.query_documents(questions[0], vectorstore, use_cache=False)
+    latencies = []
+    for question in questions:
+        began = time.perf_counter()
+        engine.query_documents(question, vectorstore, use_cache=False)
+        latencies.append(time.perf_counter() - began)
+
+    return {
+        "pages": total_pages,
+        "chunks": chunks,
+        "extract_seconds": extract_seconds,
+        "ingest_seconds": ingest_seconds,
+        "pages_per_second": total_pages / extract_seconds,
+        "chunks_per_second": chunks / ingest_seconds,
+        "query_p50_ms": percentile(latencies, 50) * 1000,
+        "query_p99_ms": percentile(latencies, 99) * 1000,
+        "peak_rss_mib": peak_rss_mib(),
+        "stages": {
+            name: stats["total_seconds"] for name, stats in metrics.snapshot()["spans"].items()
+        }
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Descriptions of the tracked metrics that regressed beyond tolerance"""
+    regressions = []
+    for name, higher_is_better in TRACKED_METRICS.items():
+        expected = baseline["results"].get(name)
+        if not expected:
+            continue
+        change = results[name] / expected - 1
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{name}: {results[name]:.1f} vs baseline {expected:.1f} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=12, help="pages per document")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=2, help="PDF extraction processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency", type=float, default=0.0,
+                        help="seconds the stand-in LLM sleeps per call")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative regression before failing")
+    parser.add_argument("--save-baseline", metavar="PATH",
+                        help="write these results as the new baseline")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+    settings = {name: getattr(args, name) for name in CORPUS_SETTINGS}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"Ingesting {args.documents} synthetic PDFs of {args.pages} pages...", file=sys.stderr)
+        results = run_pipeline(
+            workdir, args.documents, args.pages, args.queries, args.workers,
+            args.seed, args.llm_latency
+        )
+
+    if args.json:
+        print(json.dumps({"settings": settings, "results": results}, indent=2))
+    else:
+        print(
+            f"{results['pages']} pages, {results['chunks']} chunks\n"
+            f"extraction: {results['pages_per_second']:.1f} pages/s "
+            f"({results['extract_seconds']:.2f}s)\n"
+            f"ingestion:  {results['chunks_per_second']:.1f} chunks/s "
+            f"({results['ingest_seconds']:.2f}s)\n"
+            f"queries:    p50 {results['query_p50_ms']:.2f} ms, p99 {results['query_p99_ms']:.2f} ms\n"
+            f"peak RSS:   {results['peak_rss_mib']:.0f} MiB"
+        )
+        slowest = sorted(results["stages"].items(), key=lambda item: -item[1])[:8]
+        print("slowest stages: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in slowest))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+            f.write("\n")
+        return 0
+
+    if not args.baseline or not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("settings") != settings:
+        print(f"Baseline {args.baseline} used other settings; not compared", file=sys.stderr)
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
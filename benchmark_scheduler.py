@@ -0,0 +1,92 @@
+"""Check EmbeddingScheduler's retries and rate budget against the fake embedding server.
+
+Starts fake_embedding_server.py in this process, answering a share of
+requests with HTTP 429, and embeds texts through one scheduler in several
+embed() calls, the way ingestion makes them (one per INGEST_BATCH_SIZE
+chunks):
+
+    python benchmark_scheduler.py
+    python benchmark_scheduler.py --fail-rate 0.3 --requests-per-minute 120
+
+Checks that every vector matches the server's, that rate-limited requests
+were retried, and that the calls together took at least as long as the
+per-minute request budget allows. The exit status is 1 when a check fails.
+"""
+import argparse
+import logging
+import random
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+
+from embedding_scheduler import EmbeddingScheduler
+from fake_embedding_server import fake_vector, make_handler
+
+
+def start_server(dimensions, fail_rate):
+    """Fake endpoint on a free local port; returns (server, base URL)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(dimensions, fail_rate, 0.0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=5, help="embed() calls")
+    parser.add_argument("--texts", type=int, default=52, help="texts per call")
+    parser.add_argument("--batch-size", type=int, default=1, help="texts per request")
+    parser.add_argument("--requests-per-minute", type=int, default=240)
+    parser.add_argument("--fail-rate", type=float, default=0.2)
+    parser.add_argument("--dimensions", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    from langchain_openai import OpenAIEmbeddings
+
+    random.seed(args.seed)
+    server, base_url = start_server(args.dimensions, args.fail_rate)
+    # The OpenAI client's own retries would hide the 429s from the scheduler
+    embeddings = OpenAIEmbeddings(
+        model="fake-embedding", base_url=base_url, api_key="fake", max_retries=0,
+        check_embedding_ctx_length=False
+    )
+    scheduler = EmbeddingScheduler(
+        embeddings, batch_size=args.batch_size, max_concurrency=4,
+        requests_per_minute=args.requests_per_minute, tokens_per_minute=10**9,
+        max_retries=10, backoff_base=0.05, backoff_max=1.0
+    )
+
+    mismatches = retries = requests = 0
+    began = time.perf_counter()
+    for call in range(args.calls):
+        texts = [f"chunk {call}-{i}: " + "lorem ipsum " * (i % 7) for i in range(args.texts)]
+        ids = [f"{call}:{i}" for i in range(args.texts)]
+        vectors = scheduler.embed(ids, texts)
+        mismatches += sum(
+            not np.allclose(vectors[i], fake_vector(text, args.dimensions), atol=1e-6)
+            for i, text in zip(ids, texts)
+        )
+        retries += scheduler.stats["retries"]
+        requests += scheduler.stats["batches"]
+    elapsed = time.perf_counter() - began
+    server.shutdown()
+
+    # The bucket starts with one minute's worth of requests; the rest wait for refills
+    minimum = max(0, requests - args.requests_per_minute) * 60 / args.requests_per_minute
+    total = args.calls * args.texts
+    print(f"vectors: {total - mismatches}/{total} match the server's")
+    print(f"retries: {retries} rate-limited requests retried (fail rate {args.fail_rate})")
+    print(
+        f"budget: {requests} requests in {elapsed:.2f}s "
+        f"(at least {minimum:.2f}s at {args.requests_per_minute}/min)"
+    )
+    failed = mismatches or (args.fail_rate > 0 and not retries) or elapsed < 0.95 * minimum
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
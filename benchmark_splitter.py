@@ -0,0 +1,149 @@
+"""Golden check and throughput comparison of OffsetTextSplitter against LangChain.
+
+Splits the same texts with LangChain's RecursiveCharacterTextSplitter and
+with text_splitter.OffsetTextSplitter, checks that every chunk and
+start_index is identical, checks that DocumentProcessor.iter_chunks (the
+page-streaming ingest path) yields the same chunks as splitting the joined
+pages, and reports the throughput of both splitters:
+
+    python benchmark_splitter.py
+    python benchmark_splitter.py --pdf paper1.pdf paper2.pdf --min-speedup 3
+
+Texts are synthetic papers (see benchmark_pipeline.py) plus edge cases with
+long unbroken runs, blank lines and repeated text, and the pages of any
+--pdf files. The exit status is 1 on any mismatch, or when the speedup is
+below --min-speedup.
+"""
+import argparse
+import logging
+import random
+import sys
+import time
+
+from config import CHUNK_SIZE, CHUNK_OVERLAP
+from text_splitter import OffsetTextSplitter
+
+
+def edge_cases(seed=0, count=200):
+    """Texts mixing separators, whitespace, repetition and over-long words"""
+    rng = random.Random(seed)
+    pieces = [
+        "a", "word", "Results", " ", "  ", "\n", "\n\n", "\n\n\n", "\t", " \n ",
+        "x" * 60, "y" * 700, "z" * 1500, "repeated line\n", "(see Table 2)"
+    ]
+    return [
+        "".join(rng.choice(pieces) for _ in range(rng.choice([5, 50, 200, 600])))
+        for _ in range(count)
+    ]
+
+
+def synthetic_pages(documents, pages, seed=0):
+    """Page texts of synthetic papers, one list per document"""
+    from benchmark_pipeline import synthetic_paper
+
+    rng = random.Random(seed)
+    return [
+        ["\n".join(lines) + "\n" for lines in synthetic_paper(rng, pages)]
+        for _ in range(documents)
+    ]
+
+
+def pdf_texts(paths):
+    from pypdf import PdfReader
+
+    return ["".join(page.extract_text() for page in PdfReader(path).pages) for path in paths]
+
+
+def langchain_chunks(splitter, text):
+    return [(doc.metadata["start_index"], doc.page_content) for doc in splitter.create_documents([text])]
+
+
+def offset_chunks(splitter, text):
+    return [(start, text[start:end]) for start, end in splitter.split_offsets(text)]
+
+
+def golden_check(texts, chunk_size, chunk_overlap):
+    """Indices of texts whose chunks differ from LangChain's"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    reference = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
+    )
+    splitter = OffsetTextSplitter(chunk_size, chunk_overlap)
+    return [
+        i for i, text in enumerate(texts)
+        if langchain_chunks(reference, text) != offset_chunks(splitter, text)
+    ]
+
+
+def stream_check(documents):
+    """Indices of documents whose streamed chunks differ from splitting their whole text"""
+    from document_processor import DocumentProcessor
+
+    processor = DocumentProcessor()
+    return [
+        i for i, pages in enumerate(documents)
+        if list(processor.iter_chunks(iter(pages))) != processor._split_with_offsets("".join(pages))
+    ]
+
+
+def throughput(splits, texts, repeat):
+    """Best-of-repeat characters per second of each split function
+
+    Repeats alternate between the functions, so load on the machine affects
+    them alike.
+    """
+    characters = sum(len(text) for text in texts)
+    best = [float("inf")] * len(splits)
+    for _ in range(repeat):
+        for i, split in enumerate(splits):
+            began = time.perf_counter()
+            for text in texts:
+                split(text)
+            best[i] = min(best[i], time.perf_counter() - began)
+    return [characters / seconds for seconds in best]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=12, help="pages per synthetic document")
+    parser.add_argument("--pdf", nargs="*", default=[], help="also check these PDFs")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-speedup", type=float, default=0.0)
+    args = parser.parse_args()
+    # LangChain logs a warning for every over-long chunk in the edge cases
+    logging.getLogger("langchain_text_splitters").setLevel(logging.ERROR)
+
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    documents = synthetic_pages(args.documents, args.pages)
+    corpus = ["".join(pages) for pages in documents] + pdf_texts(args.pdf)
+    texts = corpus + edge_cases()
+    mismatches = golden_check(texts, args.chunk_size, args.chunk_overlap)
+    print(f"golden check: {len(texts) - len(mismatches)}/{len(texts)} texts identical")
+    for i in mismatches[:5]:
+        print(f"  mismatch in text {i}: {texts[i][:60]!r}...", file=sys.stderr)
+    stream_mismatches = stream_check(documents)
+    print(f"stream check: {len(documents) - len(stream_mismatches)}/{len(documents)} documents identical")
+
+    reference = RecursiveCharacterTextSplitter(
+        chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap, add_start_index=True
+    )
+    splitter = OffsetTextSplitter(args.chunk_size, args.chunk_overlap)
+    langchain_rate, offset_rate = throughput(
+        [lambda text: langchain_chunks(reference, text), splitter.split_offsets], corpus, args.repeat
+    )
+    speedup = offset_rate / langchain_rate
+    print(
+        f"throughput on {sum(len(text) for text in corpus) / 2**20:.1f} MiB: "
+        f"LangChain {langchain_rate / 2**20:.1f} MiB/s, "
+        f"offsets {offset_rate / 2**20:.1f} MiB/s ({speedup:.1f}x)"
+    )
+    return 1 if mismatches or stream_mismatches or speedup < args.min_speedup else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Cold-start import time of the app modules.
+
+Imports each module in a fresh interpreter with `python -X importtime` and
+reports its cumulative import time and the slowest modules it pulled in:
+
+    python benchmark_startup.py
+    python benchmark_startup.py app_modules rag_engine --repeat 5 --top 10
+    python benchmark_startup.py --max-seconds 0.5
+
+Times are the median over --repeat runs. With --max-seconds the exit status
+is 1 when any module takes longer than that to import, so a heavy import
+that slips back to module level fails the check.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# What the Streamlit apps import before rendering their first element
+DEFAULT_MODULES = [
+    "config", "corpus_manifest", "document_processor", "rag_engine",
+    "ingestion_jobs", "streamlit"
+]
+
+
+def import_times(module):
+    """{imported module: cumulative microseconds} for one cold import of `module`
+
+    Only `module` and what it pulls in are kept, not the interpreter's own
+    start-up imports (site and friends).
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [os.path.dirname(os.path.abspath(__file__)), os.environ.get("PYTHONPATH", "")]
+    ))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr.strip().splitlines()[-1]}")
+    times = {}
+    for line in completed.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package", nested by indentation
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            # A top-level import finished; its subtree is everything since the last one
+            if name.strip() == module:
+                times[module] = int(cumulative)
+                return times
+            times = {}
+            continue
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def measure(module, repeat):
+    """Median seconds to import `module` and the median cost of each dependency"""
+    runs = [import_times(module) for _ in range(repeat)]
+    total = statistics.median(run.get(module, 0) for run in runs) / 1e6
+    names = set().union(*runs)
+    dependencies = {
+        name: statistics.median(run.get(name, 0) for run in runs) / 1e6
+        for name in names if name != module
+    }
+    return total, dependencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5,
+                        help="slowest dependencies to list per module")
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="fail when a module takes longer than this to import")
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules:
+        total, dependencies = measure(module, args.repeat)
+        print(f"{module:<24} {total * 1000:8.1f} ms")
+        # Only top-level packages, so nested submodules don't repeat their parent
+        packages = {name: seconds for name, seconds in dependencies.items() if "." not in name}
+        for name, seconds in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {name:<20} {seconds * 1000:8.1f} ms")
+        if args.max_seconds is not None and total > args.max_seconds:
+            failures.append(module)
+
+    if failures:
+        print(f"Slower than {args.max_seconds}s to import: {', '.join(failures)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,102 @@ load_dotenv()
 
 # API Configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Point at a local stand-in such as fake_embedding_server.py for offline runs
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
+
+# Storage Configuration
+DATA_DIR = os.getenv("DATA_DIR", "./data")
+CHROMA_DB_DIR = os.path.join(DATA_DIR, "chroma_db")
+
+# Extraction Configuration
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+EXTRACTION_PAGES_PER_TASK = int(os.getenv("EXTRACTION_PAGES_PER_TASK", "50"))
+# "sections" (section_extractor.py) drops running headers/footers and the
+# DROPPED_SECTIONS, chunks within each detected section and tags chunks with
+# their "section" type; "text" chunks the raw page text
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "text")
+DROPPED_SECTIONS = [s.strip() for s in os.getenv("DROPPED_SECTIONS", "references").split(",") if s.strip()]
+# Page texts of every extracted PDF, keyed by file hash, so re-uploads skip parsing
+EXTRACTION_CACHE = os.getenv("EXTRACTION_CACHE", "true").lower() in ("1", "true", "yes")
+EXTRACTION_CACHE_PATH = os.path.join(DATA_DIR, "extraction_cache.db")
+EXTRACTION_CACHE_MAX_MB = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "512"))
+
+# Ingestion Job Configuration
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+# Files of a job extracted together and published as one corpus version
+INGESTION_BATCH_FILES = int(os.getenv("INGESTION_BATCH_FILES", "16"))
+INGESTION_JOBS_PATH = os.path.join(DATA_DIR, "ingestion_jobs.db")
+UPLOAD_DIR = os.path.join(DATA_DIR, "uploads")
+
+# Chunking Configuration
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+
+# Embedding Configuration
+# "openai", "sentence-transformers" (local CPU) or "hash" (deterministic word
+# hashing for offline tests and benchmarks); shared by ingestion and querying
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "64"))
+LOCAL_EMBEDDING_PROCESSES = int(os.getenv("LOCAL_EMBEDDING_PROCESSES", "1"))
+HASH_EMBEDDING_DIMENSIONS = int(os.getenv("HASH_EMBEDDING_DIMENSIONS", "384"))
+EMBEDDING_CACHE_PATH = os.path.join(DATA_DIR, "embedding_cache.db")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+EMBEDDING_REQUESTS_PER_MINUTE = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "3000"))
+EMBEDDING_TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+
+# Vector Index Configuration
+# "chroma" searches Chroma's float32 HNSW index; "quantized" searches a
+# memory-mapped int8 copy (quantized_index.py) with float16 re-ranking
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "chroma")
+# IVF lists for the quantized index: "auto" (~2*sqrt(N) above 20k chunks), or 0 for a full scan
+QUANTIZED_IVF_LISTS = os.getenv("QUANTIZED_IVF_LISTS", "auto")
+QUANTIZED_IVF_NPROBE = int(os.getenv("QUANTIZED_IVF_NPROBE", "16"))
+# Candidates re-ranked per result requested
+QUANTIZED_RERANK_FACTOR = int(os.getenv("QUANTIZED_RERANK_FACTOR", "8"))
+
+# Query Configuration
+# "hybrid" fuses BM25 and vector rankings; "dense" uses vector similarity only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Retrieved chunks are packed into the "stuff" prompt under this many tokens,
+# leaving room for the template and the 1,500-token answer in a 4k context
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "true").lower() in ("1", "true", "yes")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# 1.0 ranks purely by relevance; lower values favour chunks unlike those already picked
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 3600)))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+
+# Corpus Analysis Configuration
+ANALYSIS_MAX_WORKERS = int(os.getenv("ANALYSIS_MAX_WORKERS", "8"))
+# Character budgets for one map call (paper text) and one reduce call (summaries);
+# ~2,000 tokens each leaves room for the completion in a 4k-context model
+MAP_INPUT_CHARS = int(os.getenv("MAP_INPUT_CHARS", "8000"))
+REDUCE_INPUT_CHARS = int(os.getenv("REDUCE_INPUT_CHARS", "8000"))
+SUMMARY_STORE_PATH = os.path.join(DATA_DIR, "summaries.db")
+# Longer papers are summarized section by section, then from the section summaries
+SECTION_SUMMARY_CHARS = int(os.getenv("SECTION_SUMMARY_CHARS", "6000"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "400"))
+# Build paper summaries right after ingestion instead of on the first analysis
+SUMMARIZE_ON_INGEST = os.getenv("SUMMARIZE_ON_INGEST", "true").lower() in ("1", "true", "yes")
+
+# Instrumentation Configuration
+# Per-stage timings and counters (instrumentation.py); off costs one flag check per span
+INSTRUMENTATION = os.getenv("INSTRUMENTATION", "true").lower() in ("1", "true", "yes")
+METRICS_JSONL_PATH = os.path.join(DATA_DIR, "metrics.jsonl")
+METRICS_PROMETHEUS_PATH = os.path.join(DATA_DIR, "metrics.prom")
+# USD per 1,000 tokens, for the cost estimate (gpt-3.5-turbo-instruct, ada-002)
+LLM_PROMPT_COST_PER_1K = float(os.getenv("LLM_PROMPT_COST_PER_1K", "0.0015"))
+LLM_COMPLETION_COST_PER_1K = float(os.getenv("LLM_COMPLETION_COST_PER_1K", "0.002"))
+EMBEDDING_COST_PER_1K = float(os.getenv("EMBEDDING_COST_PER_1K", "0.0001"))
 
 # Prompt Templates
 RESEARCH_SYNTHESIS_PROMPT = """
@@ -39,14 +135,27 @@ Style: {writing_style}
 Response:
 """
 
+OUTPUT_FORMAT_PROMPT = """
+Rewrite the following research synthesis as a {output_format}.
+
+Original Content: {content}
+
+Follow the usual structure, headings and length of a {output_format} in academic
+publishing. Use only the information in the original content.
+
+{output_format}:
+"""
+
 # Advanced Comparative Analysis Prompts
 COMPARATIVE_ANALYSIS_PROMPT = """
 You are an expert research analyst performing comparative analysis across multiple research papers.
 
-Based on the following documents about {topic}, provide a comprehensive comparative analysis:
+Based on the following per-paper summaries about {topic}, provide a comprehensive comparative analysis:
 
 Documents: {context}
 
+Focus of this report: {focus}
+
 Please analyze:
 1. Methodological approaches used across papers
 2. Consistent findings vs conflicting results  
@@ -68,3 +177,47 @@ Context: {context}
 
 Provide actionable research gap analysis:
 """
+
+# Map step of the corpus analyses: one summary per paper, cached by document hash
+# and a hash of the summary prompts, so editing them re-summarizes every paper
+PAPER_SUMMARY_PROMPT = """
+Summarize the research paper "{source}" for a later comparison with other papers.
+
+Paper text (or summaries of its consecutive parts): {content}
+
+Write at most 150 words under these headings:
+Methodology: study design, data, sample and analysis methods
+Findings: main quantitative and qualitative results
+Limitations: stated or evident limitations and open questions
+
+Summary:
+"""
+
+# First level of the hierarchy for papers longer than MAP_INPUT_CHARS
+SECTION_SUMMARY_PROMPT = """
+Summarize this part ({position}) of the research paper "{source}".
+
+Text: {content}
+
+In at most 120 words, note any methodology details, results (keep the numbers)
+and limitations it contains. Skip anything that is not in the text.
+
+Summary:
+"""
+
+# Used when the paper summaries do not fit one reduce prompt
+SUMMARY_COLLAPSE_PROMPT = """
+Condense the following paper summaries into one shorter set of notes. Keep every
+paper's name next to its methodology, findings and limitations, and keep all
+numbers that would matter when comparing papers.
+
+Summaries: {context}
+
+Condensed notes:
+"""
+
+COMPARATIVE_ANALYSIS_FOCUS = {
+    "methodology_comparison": "methodological approaches, study designs and data sources used across papers",
+    "findings_comparison": "consistent findings vs conflicting results, and the knowledge gaps they reveal",
+    "research_evolution": "how the research questions, methods and conclusions have evolved over time"
+}
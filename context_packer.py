@@ -0,0 +1,207 @@
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+from embedding_scheduler import estimate_tokens
+from config import CONTEXT_TOKEN_BUDGET, MMR_LAMBDA
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+
+def token_counter(model_name=None):
+    """Return a function counting tokens the way model_name does
+
+    tiktoken downloads its encodings on first use; when that is not possible
+    (offline, or tiktoken missing) the ~4 characters per token estimate is
+    used instead.
+    """
+    with _encoders_lock:
+        if model_name not in _encoders:
+            try:
+                import tiktoken
+                try:
+                    encoding = tiktoken.encoding_for_model(model_name or "")
+                except KeyError:
+                    encoding = tiktoken.get_encoding("cl100k_base")
+                _encoders[model_name] = lambda text: len(encoding.encode(text, disallowed_special=()))
+            except Exception:
+                _encoders[model_name] = estimate_tokens
+        return _encoders[model_name]
+
+
+def _span(doc):
+    """(document key, start, end) of a chunk, or None when offsets are unknown"""
+    metadata = doc.metadata
+    start = metadata.get("start_index")
+    if start is None:
+        return None
+    key = metadata.get("doc_hash") or metadata.get("source")
+    return key, start, metadata.get("end_index", start + len(doc.page_content))
+
+
+def _unseen_text(doc, selected_spans):
+    """Part of a chunk not already covered by selected chunks of the same document"""
+    span = _span(doc)
+    text = doc.page_content
+    if span is None:
+        return text
+    key, start, end = span
+    lo, hi = start, end
+    for other_key, other_start, other_end in selected_spans:
+        if other_key != key or other_end <= lo or other_start >= hi:
+            continue
+        if other_start <= lo:
+            lo = min(hi, other_end)
+        elif other_end >= hi:
+            hi = max(lo, other_start)
+    return text[lo - start:hi - start]
+
+
+def merge_adjacent(docs):
+    """Merge chunks of one document whose offsets overlap or touch
+
+    The merged passage keeps the position of its first chunk in `docs`, its
+    text has every overlapping stretch once, and its metadata spans all the
+    merged chunks (offsets and pages).
+    """
+    passages = []
+    open_spans = {}
+    for doc in docs:
+        span = _span(doc)
+        if span is None:
+            passages.append(Document(page_content=doc.page_content, metadata=dict(doc.metadata)))
+            continue
+        passages.append(None)
+        open_spans.setdefault(span[0], []).append((span[1], span[2], len(passages) - 1, doc))
+
+    for chunks in open_spans.values():
+        chunks.sort(key=lambda chunk: chunk[0])
+        group = [chunks[0]]
+        for chunk in chunks[1:] + [None]:
+            if chunk is not None and chunk[0] <= max(end for _, end, _, _ in group):
+                group.append(chunk)
+                continue
+            position = min(position for _, _, position, _ in group)
+            passages[position] = _merge_group(group)
+            group = [chunk]
+    return [passage for passage in passages if passage is not None]
+
+
+def _merge_group(group):
+    text = ""
+    end = None
+    for start, chunk_end, _, doc in group:
+        if end is None:
+            text = doc.page_content
+        elif chunk_end > end:
+            text += doc.page_content[end - start:]
+        end = chunk_end if end is None else max(end, chunk_end)
+    metadata = dict(group[0][3].metadata)
+    metadata["end_index"] = end
+    pages = [doc.metadata.get("page") for _, _, _, doc in group if doc.metadata.get("page")]
+    if pages:
+        metadata["page"] = min(pages)
+        metadata["end_page"] = max(
+            doc.metadata.get("end_page", doc.metadata.get("page")) or 0
+            for _, _, _, doc in group
+        )
+    return Document(page_content=text, metadata=metadata)
+
+
+class ContextPacker:
+    """Choose retrieved chunks for a "stuff" prompt under a token budget
+
+    Candidates arrive in relevance order with their embeddings. Chunks are
+    picked greedily by maximal marginal relevance (relevance to the query
+    minus similarity to chunks already picked), each costing only the
+    tokens it adds beyond the overlap with picked neighbours. Picking stops
+    at max_chunks or when nothing else fits the budget; adjacent picks are
+    then merged into single passages so shared text is sent once.
+    """
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, mmr_lambda=MMR_LAMBDA, model_name=None):
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.count_tokens = token_counter(model_name)
+        self.last_stats = {"candidates": 0, "chunks": 0, "passages": 0, "tokens": 0}
+
+    def pack(self, candidates, query_vector=None, max_chunks=None):
+        """Return the passages to stuff into the prompt
+
+        `candidates` is a list of (Document, embedding or None), best first.
+        """
+        if not candidates:
+            self.last_stats = {"candidates": 0, "chunks": 0, "passages": 0, "tokens": 0}
+            return []
+        relevance, similarity = self._scores(candidates, query_vector)
+
+        remaining = list(range(len(candidates)))
+        selected = []
+        selected_spans = []
+        used = 0
+        while remaining and (max_chunks is None or len(selected) < max_chunks):
+            if selected:
+                redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining))
+            scores = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            for position in np.argsort(-scores, kind="stable"):
+                index = remaining[position]
+                doc = candidates[index][0]
+                unseen = _unseen_text(doc, selected_spans)
+                cost = self.count_tokens(unseen) if unseen.strip() else 0
+                if used + cost <= self.token_budget:
+                    break
+                if not selected:
+                    # Even the best chunk overflows: send the part that fits
+                    doc = self._truncate(doc)
+                    candidates[index] = (doc, candidates[index][1])
+                    cost = self.count_tokens(doc.page_content)
+                    break
+            else:
+                break
+            remaining.remove(index)
+            if cost == 0:
+                # Entirely covered by chunks already picked
+                continue
+            selected.append(index)
+            used += cost
+            span = _span(doc)
+            if span is not None:
+                selected_spans.append(span)
+
+        passages = merge_adjacent([candidates[i][0] for i in selected])
+        self.last_stats = {
+            "candidates": len(candidates),
+            "chunks": len(selected),
+            "passages": len(passages),
+            "tokens": sum(self.count_tokens(p.page_content) for p in passages)
+        }
+        return passages
+
+    def _scores(self, candidates, query_vector):
+        """Query relevance per candidate and pairwise candidate similarity"""
+        vectors = [vector for _, vector in candidates]
+        count = len(candidates)
+        # Rank-based fallback keeps the retriever's order when vectors are missing
+        rank_relevance = 1.0 - np.arange(count) / max(count, 1)
+        if query_vector is None or any(vector is None for vector in vectors):
+            return rank_relevance, np.eye(count)
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+        query = np.asarray(query_vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        return matrix @ query, matrix @ matrix.T
+
+    def _truncate(self, doc):
+        text = doc.page_content
+        # Shrink proportionally until the token count fits
+        while text and self.count_tokens(text) > self.token_budget:
+            text = text[:int(len(text) * self.token_budget / self.count_tokens(text) * 0.95)]
+        metadata = dict(doc.metadata)
+        if metadata.get("start_index") is not None:
+            metadata["end_index"] = metadata["start_index"] + len(text)
+        return Document(page_content=text, metadata=metadata)
@@ -0,0 +1,260 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_openai import OpenAI
+from corpus_manifest import CorpusManifest, document_hash
+from summary_store import SummaryStore
+from instrumentation import metrics
+from text_splitter import OffsetTextSplitter
+from config import (
+    PAPER_SUMMARY_PROMPT, SECTION_SUMMARY_PROMPT, SUMMARY_COLLAPSE_PROMPT,
+    ANALYSIS_MAX_WORKERS, MAP_INPUT_CHARS, REDUCE_INPUT_CHARS, SECTION_SUMMARY_CHARS,
+    SUMMARY_MAX_TOKENS, OPENAI_API_BASE
+)
+
+
+def prompt_version(*parts):
+    """Short hash identifying a prompt (and model) that produced cached output"""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def _merge_chunks(texts, metadatas):
+    """Rebuild a document's text from its chunks, dropping the overlap between neighbours"""
+    chunks = sorted(
+        zip(texts, metadatas),
+        key=lambda item: (item[1] or {}).get("start_index", 0)
+    )
+    parts = []
+    end = None
+    for text, metadata in chunks:
+        start = (metadata or {}).get("start_index")
+        if start is not None and end is not None and start <= end:
+            # Contiguous with the previous chunk: append only the unseen tail
+            parts.append(text[end - start:])
+        else:
+            parts.append(("\n" if parts else "") + text)
+        if start is not None:
+            end = max(end or 0, start + len(text))
+    return "".join(parts)
+
+
+def _group_consecutive(items, max_chars, size=len):
+    """Split items into runs whose joined size fits max_chars, keeping their order
+
+    Items too long to share a group are paired anyway, so every round of
+    condensing at least halves their number.
+    """
+    groups = []
+    for item in items:
+        if groups and sum(size(i) + 2 for i in groups[-1]) + size(item) <= max_chars:
+            groups[-1].append(item)
+        else:
+            groups.append([item])
+    if len(groups) == len(items):
+        groups = [items[i:i + 2] for i in range(0, len(items), 2)]
+    return groups
+
+
+def _join_parts(parts):
+    return "\n\n".join(f"Part {i + 1}: {summary}" for i, summary in enumerate(parts))
+
+
+def list_documents(vectorstore):
+    """[(source, doc_hash, where)] for every document in a collection
+
+    `where` is the Chroma filter selecting the document's chunks. Collections
+    written without a manifest are grouped by their "source" tag instead.
+    """
+    persist_directory = getattr(vectorstore, "_persist_directory", None)
+    if persist_directory:
+        manifest = CorpusManifest(persist_directory)
+        if manifest.documents:
+            return [
+                (name, entry["hash"], {"doc_hash": entry["hash"]})
+                for name, entry in sorted(manifest.documents.items())
+            ]
+
+    batch = vectorstore._collection.get(include=["documents", "metadatas"])
+    grouped = {}
+    for text, metadata in zip(batch["documents"], batch["metadatas"]):
+        source = (metadata or {}).get("source", "Unknown source")
+        grouped.setdefault(source, ([], []))
+        grouped[source][0].append(text)
+        grouped[source][1].append(metadata)
+    return [
+        (source, document_hash(_merge_chunks(*grouped[source])), {"source": source})
+        for source in sorted(grouped)
+    ]
+
+
+def document_text(vectorstore, where):
+    """A document's full text reassembled from its stored chunks"""
+    batch = vectorstore._collection.get(where=where, include=["documents", "metadatas"])
+    return _merge_chunks(batch["documents"], batch["metadatas"])
+
+
+class CorpusAnalyzer:
+    """Map-reduce analysis over every paper in a collection
+
+    Map: every paper gets a summary of its methodology, findings and
+    limitations. Papers longer than MAP_INPUT_CHARS are summarized
+    hierarchically: each section of SECTION_SUMMARY_CHARS first, then the
+    paper from its section summaries. When those do not fit MAP_INPUT_CHARS
+    either, runs of consecutive section summaries are condensed first, so
+    the end of a long paper is never cut off. All LLM calls run on one bounded thread
+    pool, and results are stored in the SummaryStore by document hash +
+    prompt version, so after adding one paper only that paper is summarized.
+    DocumentProcessor builds them at ingest time with the same settings.
+
+    Reduce: the summaries are combined into one prompt. When they do not fit
+    REDUCE_INPUT_CHARS, groups of them are first condensed in parallel until
+    they do.
+    """
+
+    def __init__(self, llm=None, store=None, max_workers=ANALYSIS_MAX_WORKERS):
+        self.llm = llm if llm is not None else OpenAI(
+            temperature=0, max_tokens=SUMMARY_MAX_TOKENS, base_url=OPENAI_API_BASE
+        )
+        self.store = store if store is not None else SummaryStore()
+        self.max_workers = max_workers
+        self.prompt_version = prompt_version(
+            PAPER_SUMMARY_PROMPT, SECTION_SUMMARY_PROMPT, str(SECTION_SUMMARY_CHARS),
+            # Long papers' summaries from before part summaries were condensed lost their end
+            f"map-{MAP_INPUT_CHARS}",
+            getattr(self.llm, "model_name", type(self.llm).__name__)
+        )
+        self.section_splitter = OffsetTextSplitter(SECTION_SUMMARY_CHARS, chunk_overlap=0)
+        self.last_run = {
+            "documents": 0, "map_calls": 0, "section_calls": 0, "cached": 0, "collapse_calls": 0
+        }
+
+    def summarize_documents(self, vectorstore, sources=None):
+        """Return {source: summary}, summarizing only papers not already stored"""
+        documents = list_documents(vectorstore)
+        if sources:
+            wanted = set(sources)
+            documents = [doc for doc in documents if doc[0] in wanted]
+
+        by_hash = self.store.get_many([doc_hash for _, doc_hash, _ in documents], self.prompt_version)
+        # Identical files uploaded under two names are summarized once
+        pending = {}
+        for source, doc_hash, where in documents:
+            if doc_hash not in by_hash:
+                pending.setdefault(doc_hash, (source, where))
+
+        self.last_run = {
+            "documents": len(documents),
+            "map_calls": len(pending),
+            "section_calls": 0,
+            "cached": len(documents) - len(pending),
+            "collapse_calls": 0
+        }
+        if pending:
+            by_hash.update(self._summarize_pending(vectorstore, pending))
+        return {source: by_hash[doc_hash] for source, doc_hash, _ in documents}
+
+    def _summarize_pending(self, vectorstore, pending):
+        """Section level for long papers first, then one summary per paper"""
+        texts = {
+            doc_hash: document_text(vectorstore, where)
+            for doc_hash, (_, where) in pending.items()
+        }
+        section_jobs = []
+        for doc_hash, text in texts.items():
+            if len(text) > MAP_INPUT_CHARS:
+                source = pending[doc_hash][0]
+                parts = self.section_splitter.split_text(text)
+                section_jobs.extend(
+                    (doc_hash, SECTION_SUMMARY_PROMPT.format(
+                        source=source, position=f"part {i + 1} of {len(parts)}", content=part
+                    ))
+                    for i, part in enumerate(parts)
+                )
+        sections = {}
+        for (doc_hash, _), summary in zip(
+            section_jobs, self.invoke_many(prompt for _, prompt in section_jobs)
+        ):
+            sections.setdefault(doc_hash, []).append(summary)
+        self.last_run["section_calls"] = len(section_jobs)
+
+        parts = self._condense_parts(pending, sections)
+        hashes = list(pending)
+        prompts = []
+        for doc_hash in hashes:
+            content = _join_parts(parts[doc_hash]) if doc_hash in parts else texts[doc_hash]
+            prompts.append(PAPER_SUMMARY_PROMPT.format(source=pending[doc_hash][0], content=content))
+
+        summaries = {}
+        for doc_hash, summary in zip(hashes, self.invoke_many(prompts)):
+            self.store.put(doc_hash, self.prompt_version, summary, sections.get(doc_hash, ()))
+            summaries[doc_hash] = summary
+        return summaries
+
+    def _condense_parts(self, pending, sections, max_chars=MAP_INPUT_CHARS):
+        """Part summaries of each paper, condensed in consecutive groups until they fit max_chars
+
+        A very long paper gets one more level of the hierarchy per round
+        (summaries of runs of parts) rather than losing its later parts.
+        """
+        total = {doc_hash: len(summaries) for doc_hash, summaries in sections.items()}
+        # (first part, last part, summary) per paper, in document order
+        parts = {
+            doc_hash: [(i, i, summary) for i, summary in enumerate(summaries)]
+            for doc_hash, summaries in sections.items()
+        }
+        # Room for the "Part n: " label each summary gets when joined
+        size = lambda item: len(item[2]) + 10
+        while True:
+            jobs = []
+            for doc_hash, items in parts.items():
+                if len(items) > 1 and len(_join_parts([s for _, _, s in items])) > max_chars:
+                    jobs.extend(
+                        (doc_hash, group) for group in _group_consecutive(items, max_chars, size)
+                    )
+            if not jobs:
+                break
+            prompts = [
+                SECTION_SUMMARY_PROMPT.format(
+                    source=pending[doc_hash][0],
+                    position=f"parts {group[0][0] + 1}-{group[-1][1] + 1} of {total[doc_hash]}",
+                    content=_join_parts([summary for _, _, summary in group])
+                )
+                for doc_hash, group in jobs
+            ]
+            condensed = {}
+            for (doc_hash, group), summary in zip(jobs, self.invoke_many(prompts)):
+                condensed.setdefault(doc_hash, []).append((group[0][0], group[-1][1], summary))
+            parts.update(condensed)
+            self.last_run["collapse_calls"] += len(jobs)
+        return {doc_hash: [summary for _, _, summary in items] for doc_hash, items in parts.items()}
+
+    def build_context(self, summaries, max_chars=REDUCE_INPUT_CHARS):
+        """Join summaries into one reduce context, condensing groups until it fits"""
+        sections = [f"### {source}\n{summary}" for source, summary in summaries.items()]
+        while len(sections) > 1 and sum(len(s) + 2 for s in sections) > max_chars:
+            groups = _group_consecutive(sections, max_chars)
+            sections = self.invoke_many([
+                SUMMARY_COLLAPSE_PROMPT.format(context="\n\n".join(group)[:max_chars])
+                for group in groups
+            ])
+            self.last_run["collapse_calls"] += len(groups)
+        return "\n\n".join(sections)[:max_chars]
+
+    def invoke_many(self, prompts, llm=None):
+        """Run independent prompts on the worker pool, returning texts in order
+
+        Uses the summary LLM unless another one (e.g. for reports) is given.
+        """
+        llm = llm or self.llm
+        prompts = list(prompts)
+        if not prompts:
+            return []
+
+        def invoke(prompt):
+            with metrics.span("analysis.llm"):
+                text = llm.invoke(prompt)
+            metrics.count_llm_tokens(prompt, text)
+            return text
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(prompts))) as pool:
+            return [text.strip() for text in pool.map(invoke, prompts)]
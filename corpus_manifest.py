@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+
+
+def document_hash(content):
+    """Stable content hash (of text or raw file bytes) addressing a document's chunks"""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+class CorpusManifest:
+    """Record of which document versions live in a persisted collection"""
+
+    FILENAME = "manifest.json"
+
+    def __init__(self, persist_directory):
+        self.persist_directory = persist_directory
+        self.path = os.path.join(persist_directory, self.FILENAME)
+        self.version = 0
+        self.embedding_model = None
+        self.documents = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.version = data.get("version", 0)
+            self.embedding_model = data.get("embedding_model")
+            self.documents = data.get("documents", {})
+
+    def is_current(self, name, doc_hash, chunking="text"):
+        """Whether `name` is stored at this version and was chunked the same way"""
+        entry = self.documents.get(name)
+        return (
+            entry is not None and entry["hash"] == doc_hash
+            and entry.get("chunking", "text") == chunking
+        )
+
+    def hash_in_use(self, doc_hash, exclude=None):
+        """Whether any document other than `exclude` still references doc_hash"""
+        return any(
+            entry["hash"] == doc_hash
+            for name, entry in self.documents.items()
+            if name != exclude
+        )
+
+    def record(self, name, doc_hash, num_chunks, chunking="text"):
+        self.documents[name] = {"hash": doc_hash, "chunks": num_chunks, "chunking": chunking}
+
+    def save(self):
+        """Write the manifest atomically and bump the corpus version"""
+        self.version += 1
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": self.version,
+                "embedding_model": self.embedding_model,
+                "documents": self.documents
+            }, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+_version_cache = {}
+
+
+def corpus_version(persist_directory):
+    """Version of the corpus in persist_directory, re-read only when the manifest changes"""
+    path = os.path.join(persist_directory, CorpusManifest.FILENAME)
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        return 0
+    # save() replaces the file, so the inode changes even within one mtime tick
+    stamp = (info.st_ino, info.st_mtime_ns)
+    cached = _version_cache.get(path)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, CorpusManifest(persist_directory).version)
+        _version_cache[path] = cached
+    return cached[1]
@@ -1,32 +1,548 @@
+import io
 import os
-from pypdf import PdfReader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
-import streamlit as st
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from bisect import bisect_right
+from itertools import accumulate, islice
+from config import (
+    CHROMA_DB_DIR, EXTRACTION_WORKERS, EXTRACTION_PAGES_PER_TASK,
+    CHUNK_SIZE, CHUNK_OVERLAP, INGEST_BATCH_SIZE, SUMMARIZE_ON_INGEST, VECTOR_INDEX_BACKEND,
+    EXTRACTION_MODE, DROPPED_SECTIONS, EXTRACTION_CACHE
+)
+from corpus_manifest import CorpusManifest, document_hash
+from instrumentation import metrics
+from text_splitter import OffsetTextSplitter
+
+# pypdf, LangChain, Chroma and the embedding clients take seconds to import, so
+# they are imported where first used; importing this module stays cheap for
+# the UI's cold start.
+
+# Chroma rejects oversized delete calls, so stale IDs are removed in slices
+CHROMA_BATCH_SIZE = 1000
+
+
+def _pdf_name(pdf_file, index):
+    name = getattr(pdf_file, "name", None)
+    if name is None and isinstance(pdf_file, (str, os.PathLike)):
+        name = pdf_file
+    return os.path.basename(str(name)) if name else f"document_{index + 1}.pdf"
+
+
+def _track_page_starts(pages, page_starts):
+    """Pass pages through, appending each page's document offset to page_starts"""
+    offset = 0
+    for page in pages:
+        page_starts.append(offset)
+        offset += len(page)
+        yield page
+
+
+def _chunk_metadata(name, doc_hash, start, chunk, page_starts, sections=None):
+    """Source, offsets, (when known) 1-based page span and section type of a chunk
+
+    `sections` is a pair of lists: the start offset and the type of every section.
+    """
+    end = start + len(chunk)
+    metadata = {"source": name, "doc_hash": doc_hash, "start_index": start, "end_index": end}
+    if page_starts:
+        metadata["page"] = bisect_right(page_starts, start)
+        metadata["end_page"] = bisect_right(page_starts, end - 1)
+    if sections:
+        section_starts, section_types = sections
+        metadata["section"] = section_types[bisect_right(section_starts, start) - 1]
+    return metadata
+
+
+def _read_pdf_bytes(pdf_file):
+    """Accept a path, raw bytes or a file-like upload and return its bytes"""
+    if isinstance(pdf_file, (bytes, bytearray)):
+        return bytes(pdf_file)
+    if isinstance(pdf_file, (str, os.PathLike)):
+        with open(pdf_file, "rb") as f:
+            return f.read()
+    if hasattr(pdf_file, "getvalue"):
+        return pdf_file.getvalue()
+    pdf_file.seek(0)
+    return pdf_file.read()
+
+
+def _extract_page_range(source, start, stop):
+    """Extract text for pages [start, stop) of a PDF (bytes or a file path); runs in a worker process"""
+    from pypdf import PdfReader
+
+    began = time.perf_counter()
+    reader = PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+    pages = [reader.pages[i].extract_text() for i in range(start, stop)]
+    return pages, time.perf_counter() - began
 
 class DocumentProcessor:
-    def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
-        )
-        self.embeddings = OpenAIEmbeddings()
-        
+    """Extracts, chunks, embeds and stores PDFs
+
+    Construction is cheap: the splitter, embeddings and summarizer are built
+    on first use. With extraction_mode="sections" documents are cleaned and
+    chunked section by section (see section_extractor.py).
+    """
+
+    def __init__(self, extraction_mode=EXTRACTION_MODE):
+        self.extraction_mode = extraction_mode
+        self.cache_stats = {"hits": 0, "misses": 0}
+        self.ingest_stats = {"added": 0, "skipped": 0, "deleted": 0, "summarized": 0}
+        # Chunk counts of each document of the last ingest, in input order
+        self.document_stats = []
+        # Names of the documents the last ingest added or replaced
+        self.changed_documents = []
+        self.summary_error = None
+        self._text_splitter = None
+        self._embeddings = None
+        self._embedding_scheduler = None
+        self._analyzer = None
+        self._extraction_cache = None
+        self._components_lock = threading.Lock()
+
+    @property
+    def text_splitter(self):
+        if self._text_splitter is None:
+            self._text_splitter = OffsetTextSplitter(CHUNK_SIZE, CHUNK_OVERLAP)
+        return self._text_splitter
+
+    @property
+    def embeddings(self):
+        with self._components_lock:
+            if self._embeddings is None:
+                from embedding_backends import get_embeddings, embedding_model_name
+                from embedding_cache import EmbeddingCache, CachedEmbeddings
+
+                model_name = embedding_model_name()
+                cache = EmbeddingCache()
+                # Vectors from a previous embedding model are never valid again
+                cache.invalidate_other_models(model_name)
+                self._embeddings = CachedEmbeddings(get_embeddings(), cache, model_name)
+            return self._embeddings
+
+    @property
+    def embedding_scheduler(self):
+        # Missing chunks are embedded in concurrent, rate-limited batches. Chroma
+        # itself acts as the checkpoint: chunks written before an interruption
+        # are found by ID and skipped when ingestion is re-run.
+        if self._embedding_scheduler is None:
+            from embedding_scheduler import EmbeddingScheduler
+
+            self._embedding_scheduler = EmbeddingScheduler(self.embeddings)
+        return self._embedding_scheduler
+
+    @property
+    def analyzer(self):
+        """Paper summarizer, created on first use so ingestion alone needs no LLM"""
+        if self._analyzer is None:
+            from corpus_analysis import CorpusAnalyzer
+
+            self._analyzer = CorpusAnalyzer()
+        return self._analyzer
+
+    @property
+    def extraction_cache(self):
+        """Page texts of PDFs extracted before, or None when EXTRACTION_CACHE is off"""
+        if not EXTRACTION_CACHE:
+            return None
+        with self._components_lock:
+            if self._extraction_cache is None:
+                from extraction_cache import ExtractionCache
+
+                self._extraction_cache = ExtractionCache()
+            return self._extraction_cache
+
+    def _cached_pages(self, doc_hash):
+        cache = self.extraction_cache
+        if cache is None:
+            return None
+        pages = cache.get(doc_hash)
+        metrics.increment("extraction_cache_hits" if pages is not None else "extraction_cache_misses")
+        return pages
+
+    def _store_pages(self, doc_hash, pages):
+        cache = self.extraction_cache
+        if cache is not None:
+            cache.put(doc_hash, pages)
+
     def process_pdf(self, pdf_file):
         """Extract text from PDF file"""
-        reader = PdfReader(pdf_file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text()
-        return text
+        data = _read_pdf_bytes(pdf_file)
+        doc_hash = document_hash(data)
+        pages = self._cached_pages(doc_hash)
+        if pages is None:
+            from pypdf import PdfReader
+
+            pages = [page.extract_text() for page in PdfReader(io.BytesIO(data)).pages]
+            self._store_pages(doc_hash, pages)
+        return "".join(pages)
+
+    def extract_pdfs(self, pdf_files, max_workers=EXTRACTION_WORKERS,
+                     pages_per_task=EXTRACTION_PAGES_PER_TASK):
+        """Extract many PDFs in parallel, returning results in input order
+
+        Each document is one worker task, except that PDFs longer than
+        pages_per_task are split into page ranges so they are spread across
+        workers too; those workers read the PDF from a file path rather than
+        receiving its bytes per task. Every result is a dict
+        with "name", "hash" (of the file bytes), "text", "pages" (per-page
+        text) and "seconds" (extraction time summed over the document's page
+        ranges). PDFs found in the extraction cache are not parsed at all.
+        """
+        with metrics.span("ingest.extract"):
+            results = self._extract_pdfs(pdf_files, max_workers, pages_per_task)
+        metrics.increment("documents_extracted", len(results))
+        metrics.increment("pages_extracted", sum(len(result["pages"]) for result in results))
+        return results
+
+    def _extract_pdfs(self, pdf_files, max_workers, pages_per_task):
+        sources = []
+        for i, pdf_file in enumerate(pdf_files):
+            data = _read_pdf_bytes(pdf_file)
+            doc_hash = document_hash(data)
+            path = os.fspath(pdf_file) if isinstance(pdf_file, (str, os.PathLike)) else None
+            sources.append((_pdf_name(pdf_file, i), data, doc_hash, self._cached_pages(doc_hash), path))
+
+        parallel = max_workers > 1
+        with tempfile.TemporaryDirectory(prefix="pdf-extract-") as spill_dir:
+            tasks = []
+            for index, (_, data, _, cached, path) in enumerate(sources):
+                if cached is not None:
+                    tasks.append([])
+                    continue
+                from pypdf import PdfReader
+
+                num_pages = len(PdfReader(io.BytesIO(data)).pages)
+                if not parallel or num_pages <= pages_per_task:
+                    tasks.append([(data, 0, num_pages)])
+                    continue
+                # A large document is split across workers; each opens the file
+                # itself rather than being sent its own copy of the bytes
+                if path is None:
+                    path = os.path.join(spill_dir, f"{index}.pdf")
+                    with open(path, "wb") as f:
+                        f.write(data)
+                tasks.append([
+                    (path, start, min(start + pages_per_task, num_pages))
+                    for start in range(0, num_pages, pages_per_task)
+                ])
+
+            if not parallel or not any(tasks):
+                outputs = [[_extract_page_range(*task) for task in doc_tasks] for doc_tasks in tasks]
+            else:
+                with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                    futures = [
+                        [pool.submit(_extract_page_range, *task) for task in doc_tasks]
+                        for doc_tasks in tasks
+                    ]
+                    outputs = [[future.result() for future in doc_futures] for doc_futures in futures]
+
+        results = []
+        for (name, _, doc_hash, cached, _), doc_outputs in zip(sources, outputs):
+            if cached is None:
+                pages = [page for page_texts, _ in doc_outputs for page in page_texts]
+                self._store_pages(doc_hash, pages)
+            else:
+                pages = cached
+            results.append({
+                "name": name,
+                "hash": doc_hash,
+                "text": "".join(pages),
+                "pages": pages,
+                "seconds": sum(elapsed for _, elapsed in doc_outputs)
+            })
+        return results
     
-    def create_vector_store(self, texts, persist_directory="./data/chroma_db"):
-        """Create vector database from texts"""
-        chunks = self.text_splitter.split_text(texts)
-        vectorstore = Chroma.from_texts(
-            texts=chunks,
-            embedding=self.embeddings,
-            persist_directory=persist_directory
+    def iter_pages(self, pdf_file):
+        """Yield page text lazily, one page at a time
+
+        Cached page texts are replayed without parsing; a fully read PDF's
+        pages are added to the cache.
+        """
+        data = _read_pdf_bytes(pdf_file)
+        doc_hash = document_hash(data)
+        cached = self._cached_pages(doc_hash)
+        if cached is not None:
+            yield from cached
+            return
+
+        from pypdf import PdfReader
+
+        reader = PdfReader(io.BytesIO(data))
+        pages = []
+        for page in reader.pages:
+            with metrics.span("ingest.extract_page"):
+                text = page.extract_text()
+            metrics.increment("pages_extracted")
+            pages.append(text)
+            yield text
+        self._store_pages(doc_hash, pages)
+
+    def iter_chunks(self, pages):
+        """Chunk a stream of page texts, yielding (offset, chunk) pairs
+
+        The recursive splitter picks its separators from the whole text, so
+        no bounded window reproduces its boundaries; the pages are joined and
+        split once, giving exactly the chunks (and IDs) of ingest_documents.
+        Only offsets are computed up front and each chunk is sliced as it is
+        yielded, so besides the page text just one batch of chunks is held.
+        """
+        text = "".join(pages)
+        with metrics.span("ingest.split"):
+            spans = self.text_splitter.split_offsets(text)
+        metrics.increment("chunks_split", len(spans))
+        for start, end in spans:
+            yield start, text[start:end]
+
+    def _split_with_offsets(self, text):
+        with metrics.span("ingest.split"):
+            chunks = [(start, text[start:end]) for start, end in self.text_splitter.split_offsets(text)]
+        metrics.increment("chunks_split", len(chunks))
+        return chunks
+
+    def _split_sections(self, pages, page_starts, sections):
+        """Chunk a document's cleaned text without crossing section boundaries
+
+        Returns (offset, chunk) pairs into the cleaned text, and fills in
+        page_starts with the cleaned pages' offsets and sections
+        (([start], [type])) with the detected sections.
+        """
+        from section_extractor import extract_sections
+
+        with metrics.span("ingest.sections"):
+            pages, spans = extract_sections(list(pages), DROPPED_SECTIONS)
+        text = "".join(pages)
+        page_starts.extend(accumulate((len(page) for page in pages[:-1]), initial=0))
+        chunks = []
+        for kind, start, end in spans:
+            sections[0].append(start)
+            sections[1].append(kind)
+            chunks.extend(
+                (start + offset, chunk) for offset, chunk in self._split_with_offsets(text[start:end])
+            )
+        return chunks
+
+    def ingest_documents(self, documents, persist_directory=CHROMA_DB_DIR,
+                         batch_size=INGEST_BATCH_SIZE, summarize=SUMMARIZE_ON_INGEST,
+                         on_document=None, should_stop=None):
+        """Upsert documents into the persisted collection, skipping unchanged chunks
+
+        Each document is a dict with "name" and "text", and optionally a
+        precomputed "hash" and per-page "pages" (as returned by extract_pdfs)
+        so chunks can be tagged with page numbers. Chunk IDs are
+        "<document hash>:<chunk offset>", so re-ingesting the same content
+        finds every chunk already stored. With summarize=True, new or changed
+        documents also get their paper summary built for corpus analyses.
+
+        on_document(index, chunk counts) is called as each document's chunks
+        are written. When should_stop() returns true before a document, the
+        remaining ones are skipped and those already written are published.
+        """
+        vectorstore, manifest, lexical_index = self._open_collection(persist_directory)
+        changed = []
+        for i, document in enumerate(documents):
+            if should_stop is not None and should_stop():
+                break
+            doc_hash = document.get("hash") or document_hash(document["text"])
+            sections = None
+            if self.extraction_mode == "sections":
+                page_starts, sections = [], ([], [])
+                make_chunks = lambda: iter(self._split_sections(
+                    document.get("pages") or [document["text"]], page_starts, sections
+                ))
+            else:
+                page_starts = list(accumulate(
+                    (len(page) for page in document.get("pages", [])[:-1]), initial=0
+                )) if document.get("pages") else []
+                make_chunks = lambda: iter(self._split_with_offsets(document["text"]))
+            if self._upsert_document(
+                vectorstore, manifest, lexical_index, document["name"], doc_hash,
+                make_chunks, page_starts, batch_size, sections
+            ):
+                changed.append(document["name"])
+            if on_document is not None:
+                on_document(i, self.document_stats[-1])
+        return self._finish_ingest(vectorstore, manifest, lexical_index, changed, summarize)
+
+    def stream_into_vector_store(self, pdf_files, persist_directory=CHROMA_DB_DIR,
+                                 batch_size=INGEST_BATCH_SIZE, summarize=SUMMARIZE_ON_INGEST,
+                                 on_document=None, should_stop=None):
+        """Ingest PDFs page by page, embedding and writing in bounded batches
+
+        Chunk texts and embeddings are never materialised for a whole
+        document, so peak memory is bounded by the largest single file rather
+        than the corpus. Chunk IDs, skip/replace rules and summaries match
+        ingest_documents, and so do on_document and should_stop. One
+        document's page text is held at a time (it is smaller than the PDF
+        bytes already in memory).
+        """
+        vectorstore, manifest, lexical_index = self._open_collection(persist_directory)
+        changed = []
+        for i, pdf_file in enumerate(pdf_files):
+            if should_stop is not None and should_stop():
+                break
+            data = _read_pdf_bytes(pdf_file)
+            name = _pdf_name(pdf_file, i)
+            # Filled in as pages are read; a chunk is only yielded after its page
+            page_starts = []
+            sections = None
+            if self.extraction_mode == "sections":
+                sections = ([], [])
+                make_chunks = lambda: iter(
+                    self._split_sections(self.iter_pages(io.BytesIO(data)), page_starts, sections)
+                )
+            else:
+                make_chunks = lambda: self.iter_chunks(
+                    _track_page_starts(self.iter_pages(io.BytesIO(data)), page_starts)
+                )
+            if self._upsert_document(
+                vectorstore, manifest, lexical_index, name, document_hash(data),
+                make_chunks, page_starts, batch_size, sections
+            ):
+                changed.append(name)
+            if on_document is not None:
+                on_document(i, self.document_stats[-1])
+        return self._finish_ingest(vectorstore, manifest, lexical_index, changed, summarize)
+
+    def _open_collection(self, persist_directory):
+        from langchain_community.vectorstores import Chroma
+        from lexical_index import LexicalIndex
+
+        self.ingest_stats = {"added": 0, "skipped": 0, "deleted": 0, "summarized": 0}
+        self.document_stats = []
+        self.changed_documents = []
+        self.summary_error = None
+        self.embeddings.reset_stats()
+        manifest = CorpusManifest(persist_directory)
+        model_name = self.embeddings.model_name
+        if manifest.embedding_model and manifest.embedding_model != model_name:
+            raise ValueError(
+                f"{persist_directory} holds {manifest.embedding_model} vectors; "
+                f"ingest {model_name} embeddings into a separate directory"
+            )
+        manifest.embedding_model = model_name
+        vectorstore = Chroma(
+            persist_directory=persist_directory,
+            embedding_function=self.embeddings
         )
+        lexical_index = LexicalIndex.load(persist_directory)
+        # Backfills a collection that predates the index (or whose index was
+        # lost or is missing chunks from an interrupted ingest)
+        if lexical_index.sync_with_collection(vectorstore._collection):
+            lexical_index.save(persist_directory)
+        return vectorstore, manifest, lexical_index
+
+    def _finish_ingest(self, vectorstore, manifest, lexical_index, changed, summarize=False):
+        if changed:
+            lexical_index.save(manifest.persist_directory)
+            manifest.save()
+            if VECTOR_INDEX_BACKEND == "quantized":
+                from quantized_index import ensure_quantized_index
+
+                # Rebuild now rather than on the next query's load_vector_store
+                ensure_quantized_index(vectorstore)
+        for key in ("added", "skipped", "deleted"):
+            self.ingest_stats[key] = sum(stats[key] for stats in self.document_stats)
+        self.changed_documents = changed
+        self.cache_stats = self.embeddings.stats()
+        if changed and summarize:
+            self.ingest_stats["summarized"], self.summary_error = self.summarize_ingested(
+                vectorstore, changed
+            )
         return vectorstore
+
+    def summarize_ingested(self, vectorstore, names):
+        """Build the paper summaries of ingested documents; returns (LLM map calls, error)
+
+        The chunks are already committed, so a failed summary only defers the
+        work to the first analysis instead of failing the upload. Callers that
+        hold a write lock can ingest with summarize=False and call this after
+        releasing it.
+        """
+        try:
+            with metrics.span("ingest.summarize"):
+                self.analyzer.summarize_documents(vectorstore, names)
+            return self.analyzer.last_run["map_calls"], None
+        except Exception as e:
+            return 0, str(e)
+
+    def _upsert_document(self, vectorstore, manifest, lexical_index, name, doc_hash,
+                         make_chunks, page_starts, batch_size, sections=None):
+        """Write one document's missing chunks; returns whether the corpus changed"""
+        stats = {"added": 0, "skipped": 0, "deleted": 0}
+        self.document_stats.append(stats)
+        if manifest.is_current(name, doc_hash, self.extraction_mode):
+            stats["skipped"] += manifest.documents[name]["chunks"]
+            return False
+
+        previous = manifest.documents.get(name)
+        if previous and not manifest.hash_in_use(previous["hash"], exclude=name):
+            stats["deleted"] += self._delete_document_chunks(
+                vectorstore, lexical_index, previous["hash"]
+            )
+
+        chunks = make_chunks()
+        num_chunks = 0
+        while True:
+            batch = list(islice(chunks, batch_size))
+            if not batch:
+                break
+            num_chunks += len(batch)
+            added = self._add_missing_chunks(
+                vectorstore, lexical_index, name, doc_hash, batch, page_starts, sections
+            )
+            stats["added"] += added
+            stats["skipped"] += len(batch) - added
+
+        manifest.record(name, doc_hash, num_chunks, self.extraction_mode)
+        return True
+
+    def _add_missing_chunks(self, vectorstore, lexical_index, name, doc_hash, batch, page_starts,
+                            sections=None):
+        ids = [f"{doc_hash}:{start}" for start, _ in batch]
+        with metrics.span("ingest.lookup"):
+            existing = set(vectorstore.get(ids=ids, include=[])["ids"])
+        metrics.increment("chunks_skipped", len(existing))
+        # Stored by an ingest that failed before it saved the lexical index
+        unindexed = [
+            (chunk_id, chunk) for chunk_id, (_, chunk) in zip(ids, batch)
+            if chunk_id in existing and chunk_id not in lexical_index
+        ]
+        if unindexed:
+            lexical_index.add(*zip(*unindexed))
+        new = [
+            (chunk_id, start, chunk)
+            for chunk_id, (start, chunk) in zip(ids, batch)
+            if chunk_id not in existing
+        ]
+        if new:
+            metadata = {
+                chunk_id: _chunk_metadata(name, doc_hash, start, chunk, page_starts, sections)
+                for chunk_id, start, chunk in new
+            }
+
+            def write_batch(batch_ids, texts, vectors):
+                with metrics.span("ingest.chroma_write"):
+                    vectorstore._collection.upsert(
+                        ids=batch_ids,
+                        embeddings=vectors,
+                        documents=texts,
+                        metadatas=[metadata[chunk_id] for chunk_id in batch_ids]
+                    )
+                    lexical_index.add(batch_ids, texts)
+                metrics.increment("chunks_written", len(batch_ids))
+
+            self.embedding_scheduler.embed(
+                [chunk_id for chunk_id, _, _ in new],
+                [chunk for _, _, chunk in new],
+                on_batch=write_batch
+            )
+        return len(new)
+
+    def _delete_document_chunks(self, vectorstore, lexical_index, doc_hash):
+        stale_ids = vectorstore.get(where={"doc_hash": doc_hash}, include=[])["ids"]
+        for i in range(0, len(stale_ids), CHROMA_BATCH_SIZE):
+            vectorstore.delete(ids=stale_ids[i:i + CHROMA_BATCH_SIZE])
+        lexical_index.remove(stale_ids)
+        return len(stale_ids)
@@ -0,0 +1,169 @@
+import re
+import threading
+import zlib
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from config import (
+    EMBEDDING_BACKEND, EMBEDDING_MODEL, OPENAI_API_BASE, LOCAL_EMBEDDING_MODEL,
+    LOCAL_EMBEDDING_BATCH_SIZE, LOCAL_EMBEDDING_PROCESSES, HASH_EMBEDDING_DIMENSIONS
+)
+
+EMBEDDING_DTYPES = ("float32", "float16", "int8")
+
+
+def quantize_vectors(vectors, dtype="float32"):
+    """Convert a float matrix to float32, float16 or int8
+
+    int8 scales every row by its largest absolute component, so it keeps the
+    direction (and therefore cosine similarity) but not the magnitude.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float32":
+        return vectors
+    if dtype == "float16":
+        return vectors.astype(np.float16)
+    if dtype == "int8":
+        scale = np.abs(vectors).max(axis=1, keepdims=True)
+        scale[scale == 0] = 1.0
+        return np.round(vectors / scale * 127).astype(np.int8)
+    raise ValueError(f"Unsupported embedding dtype: {dtype} (choose from {EMBEDDING_DTYPES})")
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """Local CPU embeddings computed with sentence-transformers"""
+
+    def __init__(self, model_name=LOCAL_EMBEDDING_MODEL, batch_size=LOCAL_EMBEDDING_BATCH_SIZE,
+                 num_processes=LOCAL_EMBEDDING_PROCESSES, device="cpu", normalize=True):
+        # Optional dependency: only needed when this backend is selected
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.num_processes = num_processes
+        self.normalize = normalize
+        self.model = SentenceTransformer(model_name, device=device)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def encode(self, texts, dtype="float32"):
+        """Encode texts to a NumPy matrix of the requested dtype
+
+        Large inputs are spread over a pool of worker processes when
+        num_processes > 1; small ones stay in-process, where startup cost
+        would dominate.
+        """
+        texts = list(texts)
+        if not texts:
+            return quantize_vectors(np.zeros((0, self.dimensions), dtype=np.float32), dtype)
+
+        if self.num_processes > 1 and len(texts) >= self.batch_size * self.num_processes:
+            vectors = self.model.encode_multi_process(
+                texts, self._get_pool(), batch_size=self.batch_size
+            )
+            if self.normalize:
+                norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                vectors = vectors / norms
+        else:
+            vectors = self.model.encode(
+                texts,
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=self.normalize,
+                show_progress_bar=False
+            )
+        return quantize_vectors(vectors, dtype)
+
+    @property
+    def dimensions(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = self.model.start_multi_process_pool(["cpu"] * self.num_processes)
+            return self._pool
+
+    def close(self):
+        """Stop the multi-process pool, if one was started"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self.model.stop_multi_process_pool(self._pool)
+                self._pool = None
+
+    def embed_documents(self, texts):
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text):
+        return self.encode([text])[0].tolist()
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic offline embeddings from hashed word counts
+
+    Every word adds +1 or -1 to a dimension picked by its CRC32, and vectors
+    are normalized, so texts that share words are similar. Not a semantic
+    model: it stands in for one in tests and benchmarks without network.
+    """
+
+    def __init__(self, dimensions=HASH_EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.fromiter(
+                (zlib.crc32(word.encode("utf-8")) for word in re.findall(r"\w+", text.lower())),
+                dtype=np.uint32
+            )
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+            vectors[row] = np.bincount(
+                hashes % self.dimensions, weights=signs, minlength=self.dimensions
+            )
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def embed_documents(self, texts):
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self.encode([text])[0].tolist()
+
+
+_shared_backends = {}
+_shared_lock = threading.Lock()
+
+
+def get_embeddings(backend=EMBEDDING_BACKEND):
+    """Return the process-wide embeddings for a backend
+
+    DocumentProcessor and RAGEngine both go through this function, so
+    documents and queries are always embedded by the same model instance.
+    """
+    with _shared_lock:
+        if backend not in _shared_backends:
+            if backend == "openai":
+                _shared_backends[backend] = OpenAIEmbeddings(
+                    model=EMBEDDING_MODEL, base_url=OPENAI_API_BASE
+                )
+            elif backend == "sentence-transformers":
+                _shared_backends[backend] = SentenceTransformerEmbeddings()
+            elif backend == "hash":
+                _shared_backends[backend] = HashEmbeddings()
+            else:
+                raise ValueError(f"Unknown embedding backend: {backend}")
+        return _shared_backends[backend]
+
+
+def embedding_model_name(backend=EMBEDDING_BACKEND):
+    """Name of the model behind a backend, used to key cached vectors"""
+    if backend == "openai":
+        return EMBEDDING_MODEL
+    if backend == "sentence-transformers":
+        return f"sentence-transformers/{LOCAL_EMBEDDING_MODEL}"
+    if backend == "hash":
+        return f"hash-{HASH_EMBEDDING_DIMENSIONS}"
+    raise ValueError(f"Unknown embedding backend: {backend}")
@@ -0,0 +1,177 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+from config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
+from embedding_scheduler import estimate_tokens
+from instrumentation import metrics
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_BATCH = 500
+
+
+def _encode(vector):
+    return array("f", vector).tobytes()
+
+
+def _decode(blob):
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """Persistent embedding store keyed by chunk text hash and model name"""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, "
+            "vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_model ON embeddings(model)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(text, model):
+        """Content address of a chunk for a given embedding model"""
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts, model):
+        """Return cached vectors in input order, None for misses"""
+        keys = [self.make_key(text, model) for text in texts]
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), _QUERY_BATCH):
+                batch = keys[i:i + _QUERY_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return [_decode(found[key]) if key in found else None for key in keys]
+
+    def put_many(self, texts, vectors, model):
+        """Store vectors for texts and evict least recently used entries"""
+        now = time.time()
+        rows = [
+            (self.make_key(text, model), model, _encode(vector), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                "SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (excess,)
+            )
+
+    def invalidate(self, model=None):
+        """Drop entries for one model, or everything when model is None"""
+        with self._lock:
+            if model is None:
+                self._conn.execute("DELETE FROM embeddings")
+            else:
+                self._conn.execute("DELETE FROM embeddings WHERE model = ?", (model,))
+            self._conn.commit()
+
+    def invalidate_other_models(self, model):
+        """Drop entries produced by any model other than the current one"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings WHERE model != ?", (model,))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends cache misses to the underlying model"""
+
+    def __init__(self, embeddings, cache, model_name):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts):
+        vectors, missing, unique_texts = self._lookup(texts)
+        if unique_texts:
+            with metrics.span("embedding.model"):
+                new_vectors = self.embeddings.embed_documents(unique_texts)
+            self._fill(texts, vectors, missing, unique_texts, new_vectors)
+        return vectors
+
+    async def aembed_documents(self, texts):
+        vectors, missing, unique_texts = self._lookup(texts)
+        if unique_texts:
+            with metrics.span("embedding.model"):
+                new_vectors = await self.embeddings.aembed_documents(unique_texts)
+            self._fill(texts, vectors, missing, unique_texts, new_vectors)
+        return vectors
+
+    def _lookup(self, texts):
+        vectors = self.cache.get_many(texts, self.model_name)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        # Identical chunks (e.g. repeated boilerplate) are embedded once
+        unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+        if metrics.enabled:
+            metrics.increment("embedding_cache_hits", len(texts) - len(missing))
+            metrics.increment("embedding_cache_misses", len(missing))
+            metrics.increment("embeddings", len(unique_texts))
+            metrics.increment("embedding_tokens", sum(estimate_tokens(text) for text in unique_texts))
+        return vectors, missing, unique_texts
+
+    def _fill(self, texts, vectors, missing, unique_texts, new_vectors):
+        self.cache.put_many(unique_texts, new_vectors, self.model_name)
+        by_text = dict(zip(unique_texts, new_vectors))
+        for i in missing:
+            vectors[i] = by_text[texts[i]]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+from config import (
+    EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_CONCURRENCY, EMBEDDING_REQUESTS_PER_MINUTE,
+    EMBEDDING_TOKENS_PER_MINUTE, EMBEDDING_MAX_RETRIES
+)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) for budgeting"""
+    return len(text) // 4 + 1
+
+
+class RateBudget:
+    """Token buckets refilled continuously to a per-minute request and token limit
+
+    One budget lives as long as its scheduler, so the limit holds across
+    embed() calls. Each call runs its own event loop (asyncio.run), so the
+    buckets are guarded by a thread lock, never held while waiting, rather
+    than an asyncio.Lock tied to one loop.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(
+            self.requests_per_minute,
+            self._requests + elapsed * self.requests_per_minute / 60
+        )
+        self._tokens = min(
+            self.tokens_per_minute,
+            self._tokens + elapsed * self.tokens_per_minute / 60
+        )
+
+    def _try_acquire(self, tokens):
+        """Take one request and `tokens` if both are available; else the seconds to wait"""
+        with self._lock:
+            self._refill()
+            if self._requests >= 1 and self._tokens >= tokens:
+                self._requests -= 1
+                self._tokens -= tokens
+                return 0
+            return max(
+                (1 - self._requests) * 60 / self.requests_per_minute,
+                (tokens - self._tokens) * 60 / self.tokens_per_minute,
+                0.01
+            )
+
+    async def acquire(self, tokens):
+        # A single oversized batch may exceed the bucket; let it through once full
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class EmbeddingScheduler:
+    """Embed texts in concurrent batches under a rate budget, with retries
+
+    Every completed batch is handed to `on_batch(ids, texts, vectors)` as soon
+    as it finishes, and its IDs are appended to `checkpoint_path` if one is
+    given. A re-run with the same checkpoint skips IDs that were already
+    done, so an interrupted ingest picks up where it stopped. One failing
+    batch does not discard the batches that succeeded.
+    """
+
+    def __init__(self, embeddings, batch_size=EMBEDDING_BATCH_SIZE,
+                 max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+                 requests_per_minute=EMBEDDING_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=EMBEDDING_TOKENS_PER_MINUTE,
+                 max_retries=EMBEDDING_MAX_RETRIES, checkpoint_path=None,
+                 backoff_base=1.0, backoff_max=60.0):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.checkpoint_path = checkpoint_path
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.budget = RateBudget(requests_per_minute, tokens_per_minute)
+        self.stats = {"batches": 0, "retries": 0, "skipped": 0}
+
+    def embed(self, ids, texts, on_batch=None):
+        """Synchronous wrapper around aembed"""
+        return asyncio.run(self.aembed(ids, texts, on_batch))
+
+    async def aembed(self, ids, texts, on_batch=None):
+        """Embed texts, returning {id: vector} for everything embedded in this run"""
+        self.stats = {"batches": 0, "retries": 0, "skipped": 0}
+        done = self.load_checkpoint()
+        pending = [(i, text) for i, text in zip(ids, texts) if i not in done]
+        self.stats["skipped"] = len(ids) - len(pending)
+        batches = [
+            pending[i:i + self.batch_size]
+            for i in range(0, len(pending), self.batch_size)
+        ]
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = {}
+
+        async def run(batch):
+            batch_ids = [i for i, _ in batch]
+            batch_texts = [text for _, text in batch]
+            async with semaphore:
+                await self.budget.acquire(sum(estimate_tokens(text) for text in batch_texts))
+                vectors = await self._embed_with_retry(batch_texts)
+            if on_batch is not None:
+                on_batch(batch_ids, batch_texts, vectors)
+            self._append_checkpoint(batch_ids)
+            results.update(zip(batch_ids, vectors))
+            self.stats["batches"] += 1
+
+        outcomes = await asyncio.gather(*(run(batch) for batch in batches), return_exceptions=True)
+        errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+        if errors:
+            raise errors[0]
+        self.clear_checkpoint()
+        return results
+
+    async def _embed_with_retry(self, texts):
+        attempt = 0
+        while True:
+            try:
+                return await self.embeddings.aembed_documents(texts)
+            except Exception:
+                if attempt >= self.max_retries:
+                    raise
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                attempt += 1
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay * (0.5 + random.random() / 2))
+
+    def load_checkpoint(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return set()
+        done = set()
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    done.update(json.loads(line))
+        return done
+
+    def _append_checkpoint(self, ids):
+        if not self.checkpoint_path:
+            return
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(ids) + "\n")
+
+    def clear_checkpoint(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
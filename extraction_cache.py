@@ -0,0 +1,182 @@
+"""Persistent cache of text extracted from PDFs.
+
+DocumentProcessor stores every PDF's page texts here, keyed by the SHA-256
+of the file bytes and the extractor version, so a file that is uploaded
+again is never re-parsed. Entries are compressed (zstd when the zstandard
+package is installed, gzip otherwise) and the least recently used ones are
+evicted once the cache grows past EXTRACTION_CACHE_MAX_MB:
+
+    python extraction_cache.py stats
+    python extraction_cache.py prune --max-mb 100
+    python extraction_cache.py clear
+
+prune also drops entries written by other extractor versions.
+"""
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from config import EXTRACTION_CACHE_PATH, EXTRACTION_CACHE_MAX_MB
+
+# Bump when the extraction code changes what it returns for the same file
+EXTRACTOR_VERSION = "1"
+
+
+def extractor_version():
+    """This extractor's version, including the installed pypdf's (without importing it)"""
+    from importlib.metadata import version, PackageNotFoundError
+
+    try:
+        pypdf_version = version("pypdf")
+    except PackageNotFoundError:
+        pypdf_version = "unknown"
+    return f"{EXTRACTOR_VERSION}/pypdf-{pypdf_version}"
+
+
+def _compress(data):
+    """(codec, compressed bytes), preferring zstd when it is installed"""
+    try:
+        # Optional dependency: gzip is used without it
+        import zstandard
+    except ImportError:
+        return "gzip", gzip.compress(data, compresslevel=6)
+    return "zstd", zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def _decompress(codec, blob):
+    if codec == "zstd":
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return gzip.decompress(blob)
+
+
+class ExtractionCache:
+    """Compressed page texts keyed by PDF content hash and extractor version"""
+
+    def __init__(self, path=EXTRACTION_CACHE_PATH, max_bytes=EXTRACTION_CACHE_MAX_MB * 2**20,
+                 extractor=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.extractor = extractor or extractor_version()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS extracted_pages ("
+            "doc_hash TEXT NOT NULL, extractor TEXT NOT NULL, "
+            "codec TEXT NOT NULL, pages BLOB NOT NULL, size INTEGER NOT NULL, "
+            "last_used REAL NOT NULL, PRIMARY KEY (doc_hash, extractor))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_extracted_pages_last_used ON extracted_pages(last_used)"
+        )
+        self._conn.commit()
+
+    def get(self, doc_hash):
+        """The cached page texts of a PDF, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT codec, pages FROM extracted_pages WHERE doc_hash = ? AND extractor = ?",
+                (doc_hash, self.extractor)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE extracted_pages SET last_used = ? WHERE doc_hash = ? AND extractor = ?",
+                (time.time(), doc_hash, self.extractor)
+            )
+            self._conn.commit()
+        try:
+            return json.loads(_decompress(*row))
+        except ImportError:
+            # Written with zstd, which is no longer installed
+            return None
+
+    def put(self, doc_hash, pages):
+        """Store a PDF's page texts and evict least recently used entries over max_bytes"""
+        codec, blob = _compress(json.dumps(list(pages)).encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extracted_pages "
+                "(doc_hash, extractor, codec, pages, size, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (doc_hash, self.extractor, codec, blob, len(blob), time.time())
+            )
+            self._evict(self.max_bytes)
+            self._conn.commit()
+
+    def _evict(self, max_bytes):
+        """Delete least recently used entries until the cache fits max_bytes; returns the count"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM extracted_pages").fetchone()[0]
+        if total <= max_bytes:
+            return 0
+        evicted = []
+        for doc_hash, extractor, size in self._conn.execute(
+            "SELECT doc_hash, extractor, size FROM extracted_pages ORDER BY last_used ASC"
+        ).fetchall():
+            if total <= max_bytes:
+                break
+            evicted.append((doc_hash, extractor))
+            total -= size
+        self._conn.executemany(
+            "DELETE FROM extracted_pages WHERE doc_hash = ? AND extractor = ?", evicted
+        )
+        return len(evicted)
+
+    def prune(self, max_bytes=None):
+        """Drop other extractor versions' entries, then evict down to max_bytes; returns the count"""
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM extracted_pages WHERE extractor != ?", (self.extractor,)
+            ).rowcount
+            removed += self._evict(self.max_bytes if max_bytes is None else max_bytes)
+            self._conn.commit()
+            # Give the freed pages back to the file system
+            self._conn.execute("VACUUM")
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM extracted_pages")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extracted_pages"
+            ).fetchone()
+        return {"entries": entries, "bytes": size}
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM extracted_pages").fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["stats", "prune", "clear"])
+    parser.add_argument("--path", default=EXTRACTION_CACHE_PATH)
+    parser.add_argument("--max-mb", type=float, default=EXTRACTION_CACHE_MAX_MB,
+                        help="size to prune the cache down to")
+    args = parser.parse_args()
+
+    cache = ExtractionCache(args.path)
+    if args.command == "prune":
+        removed = cache.prune(int(args.max_mb * 2**20))
+        print(f"Removed {removed} entries")
+    elif args.command == "clear":
+        cache.clear()
+    stats = cache.stats()
+    print(f"{stats['entries']} documents, {stats['bytes'] / 2**20:.1f} MiB in {args.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
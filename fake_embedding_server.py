@@ -0,0 +1,93 @@
+"""Local stand-in for the OpenAI embeddings endpoint.
+
+Run it and point the app at it to exercise ingestion without network access:
+
+    python fake_embedding_server.py --port 8765 --fail-rate 0.2
+    OPENAI_API_BASE=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake streamlit run app.py
+
+Vectors are derived from a hash of each input, so the same text always gets
+the same embedding. --fail-rate answers a share of requests with HTTP 429 to
+exercise the retry path, and --latency adds a fixed per-request delay.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import time
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_vector(item, dimensions):
+    """Deterministic unit vector for a string or token list"""
+    seed = hashlib.sha256(json.dumps(item).encode("utf-8")).digest()
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = sum(x * x for x in vector) ** 0.5 or 1.0
+    return [x / norm for x in vector]
+
+
+def make_handler(dimensions, fail_rate, latency):
+    class EmbeddingHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/embeddings"):
+                self._send(404, {"error": {"message": "not found"}})
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if latency:
+                time.sleep(latency)
+            if random.random() < fail_rate:
+                self._send(429, {"error": {"message": "rate limited", "type": "rate_limit"}})
+                return
+
+            inputs = body["input"]
+            if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+            data = []
+            for index, item in enumerate(inputs):
+                vector = fake_vector(item, dimensions)
+                if body.get("encoding_format") == "base64":
+                    vector = base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+                data.append({"object": "embedding", "index": index, "embedding": vector})
+            tokens = sum(len(item) if isinstance(item, list) else len(item) // 4 for item in inputs)
+            self._send(200, {
+                "object": "list",
+                "data": data,
+                "model": body.get("model", "fake-embedding"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+            })
+
+        def _send(self, status, payload):
+            encoded = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(encoded)))
+            self.end_headers()
+            self.wfile.write(encoded)
+
+        def log_message(self, format, *args):
+            pass
+
+    return EmbeddingHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        (args.host, args.port),
+        make_handler(args.dimensions, args.fail_rate, args.latency)
+    )
+    print(f"Fake embedding server listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
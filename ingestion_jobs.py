@@ -0,0 +1,304 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    INGESTION_JOBS_PATH, INGESTION_WORKERS, INGESTION_BATCH_FILES, UPLOAD_DIR, SUMMARIZE_ON_INGEST
+)
+
+# Job states; "queued" and "running" jobs are resumed when a queue starts
+QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED = "queued", "running", "completed", "failed", "cancelled"
+# File states; a "written" file's chunks are in the collection but its batch
+# is not published yet, so it is ingested again if the job is resumed
+PENDING, WRITTEN, DONE = "pending", "written", "done"
+
+
+class JobStore:
+    """SQLite table of ingestion jobs and the progress of each of their files"""
+
+    def __init__(self, path=INGESTION_JOBS_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, low_memory INTEGER NOT NULL, "
+            "cancel_requested INTEGER NOT NULL DEFAULT 0, error TEXT, "
+            "created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_files ("
+            "job_id TEXT NOT NULL, position INTEGER NOT NULL, name TEXT NOT NULL, "
+            "path TEXT NOT NULL, status TEXT NOT NULL, stats TEXT, error TEXT, "
+            "seconds REAL, PRIMARY KEY (job_id, position))"
+        )
+        self._conn.commit()
+
+    def create(self, job_id, files, low_memory):
+        """Record a queued job for [(name, path)]"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, low_memory, created, updated) VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, int(low_memory), now, now)
+            )
+            self._conn.executemany(
+                "INSERT INTO job_files (job_id, position, name, path, status) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, i, name, path, PENDING) for i, (name, path) in enumerate(files)]
+            )
+            self._conn.commit()
+
+    def update_job(self, job_id, **fields):
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id]
+            )
+            self._conn.commit()
+
+    def update_file(self, job_id, position, **fields):
+        if "stats" in fields:
+            fields["stats"] = json.dumps(fields["stats"])
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE job_files SET {assignments} WHERE job_id = ? AND position = ?",
+                [*fields.values(), job_id, position]
+            )
+            self._conn.execute("UPDATE jobs SET updated = ? WHERE id = ?", (time.time(), job_id))
+            self._conn.commit()
+
+    def get(self, job_id):
+        """Job dict with its "files" list, or None"""
+        with self._lock:
+            self._conn.row_factory = sqlite3.Row
+            try:
+                job = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if job is None:
+                    return None
+                files = self._conn.execute(
+                    "SELECT * FROM job_files WHERE job_id = ? ORDER BY position", (job_id,)
+                ).fetchall()
+            finally:
+                self._conn.row_factory = None
+        job = dict(job)
+        job["files"] = [
+            {**dict(row), "stats": json.loads(row["stats"]) if row["stats"] else None}
+            for row in files
+        ]
+        job["done"] = sum(1 for file in job["files"] if file["status"] == DONE)
+        job["written"] = sum(1 for file in job["files"] if file["status"] in (WRITTEN, DONE))
+        return job
+
+    def job_ids(self, statuses=None, limit=50):
+        """Most recent job IDs first, optionally only those in the given states"""
+        query = "SELECT id FROM jobs"
+        params = []
+        if statuses:
+            query += f" WHERE status IN ({','.join('?' * len(statuses))})"
+            params.extend(statuses)
+        query += " ORDER BY created DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query, params).fetchall()]
+
+
+class IngestionQueue:
+    """Runs ingestion jobs on a local worker pool, outside the Streamlit script run
+
+    Uploads are saved under UPLOAD_DIR and every job and file's state lives
+    in a JobStore, so a job survives page reruns and can be polled from any
+    session. Jobs left queued or running by a previous process are resumed
+    when the queue starts; files already done are not ingested again, and
+    Chroma's chunk IDs make a partly written file cheap to redo.
+
+    A job's files are ingested in batches of batch_files: each batch is
+    extracted with one extract_pdfs call (so its documents are parsed in
+    parallel) and published as one corpus version, instead of rebuilding the
+    lexical index, manifest and quantized index after every file. Each file
+    is marked written as soon as its chunks are stored, and done when its
+    batch is published. Batches are extracted concurrently, but writes to
+    the collection (which update the shared manifest and lexical index) are
+    serialized; paper summaries are built after the write lock is released.
+
+    Queries never wait on a job. With the Chroma backend they read the live
+    collection, so they can see a batch's chunks before it is published and
+    miss a re-uploaded document while its chunks are replaced; the
+    quantized backend searches the last published index. Cancellation takes
+    effect between documents: the documents already written are published.
+    """
+
+    def __init__(self, processor, store=None, max_workers=INGESTION_WORKERS, upload_dir=UPLOAD_DIR,
+                 batch_files=INGESTION_BATCH_FILES, summarize=SUMMARIZE_ON_INGEST):
+        self.processor = processor
+        self.store = store if store is not None else JobStore()
+        self.upload_dir = upload_dir
+        self.batch_files = max(1, batch_files)
+        self.summarize = summarize
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._write_lock = threading.Lock()
+        # The summarizer's run statistics are shared, so summaries are built
+        # one batch at a time, while other batches write
+        self._summary_lock = threading.Lock()
+        # Jobs a previous process left behind (e.g. after a restart)
+        for job_id in reversed(self.store.job_ids([QUEUED, RUNNING], limit=-1)):
+            self._requeue(self.store.get(job_id))
+
+    def submit(self, files, low_memory=False):
+        """Queue [(name, bytes)] for ingestion and return the job ID"""
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.upload_dir, job_id)
+        os.makedirs(job_dir)
+        saved = []
+        for i, (name, data) in enumerate(files):
+            name = os.path.basename(name) or f"document_{i + 1}.pdf"
+            # Keep the uploaded name (it becomes the document's "source")
+            path = os.path.join(job_dir, str(i), name)
+            os.makedirs(os.path.dirname(path))
+            with open(path, "wb") as f:
+                f.write(data)
+            saved.append((name, path))
+        self.store.create(job_id, saved, low_memory)
+        self._pool.submit(self._run, job_id)
+        return job_id
+
+    def cancel(self, job_id):
+        """Stop a job before its next file; a queued job is cancelled at once"""
+        job = self.store.get(job_id)
+        if job is None or job["status"] not in (QUEUED, RUNNING):
+            return False
+        if job["status"] == QUEUED:
+            self.store.update_job(job_id, status=CANCELLED, cancel_requested=1)
+        else:
+            self.store.update_job(job_id, cancel_requested=1)
+        return True
+
+    def resume(self, job_id):
+        """Re-queue a cancelled or failed job; files already done are skipped"""
+        job = self.store.get(job_id)
+        if job is None or job["status"] not in (CANCELLED, FAILED):
+            return False
+        self._requeue(job)
+        return True
+
+    def _requeue(self, job):
+        for file in job["files"]:
+            if file["status"] != DONE:
+                self.store.update_file(job["id"], file["position"], status=PENDING, error=None)
+        self.store.update_job(job["id"], status=QUEUED, cancel_requested=0, error=None)
+        self._pool.submit(self._run, job["id"])
+
+    def status(self, job_id):
+        return self.store.get(job_id)
+
+    def _cancelled(self, job_id):
+        job = self.store.get(job_id)
+        return job is None or bool(job["cancel_requested"])
+
+    def _run(self, job_id):
+        job = self.store.get(job_id)
+        if job is None or job["status"] != QUEUED:
+            return
+        if job["cancel_requested"]:
+            self.store.update_job(job_id, status=CANCELLED)
+            return
+        self.store.update_job(job_id, status=RUNNING)
+
+        pending = [file for file in job["files"] if file["status"] != DONE]
+        failures = 0
+        for i in range(0, len(pending), self.batch_files):
+            if self._cancelled(job_id):
+                break
+            failures += self._ingest_batch(
+                job_id, pending[i:i + self.batch_files], bool(job["low_memory"])
+            )
+
+        # Only a cancellation leaves files pending
+        if any(file["status"] == PENDING for file in self.store.get(job_id)["files"]):
+            self.store.update_job(job_id, status=CANCELLED)
+        elif failures:
+            self.store.update_job(
+                job_id, status=FAILED, error=f"{failures} of {len(job['files'])} files failed"
+            )
+        else:
+            self.store.update_job(job_id, status=COMPLETED)
+            shutil.rmtree(os.path.join(self.upload_dir, job_id), ignore_errors=True)
+
+    def _ingest_batch(self, job_id, files, low_memory):
+        """Ingest files together, marking each written, then done, or failed; returns the failures
+
+        When a batch fails, its files are retried one at a time so that one
+        broken PDF does not fail the rest; chunks the failed attempt already
+        wrote are found by ID and not embedded again. Files left unwritten by
+        a cancellation go back to pending.
+        """
+        for file in files:
+            self.store.update_file(job_id, file["position"], status=RUNNING)
+        started = last = time.perf_counter()
+
+        def written(index, stats):
+            nonlocal last
+            now = time.perf_counter()
+            self.store.update_file(
+                job_id, files[index]["position"], status=WRITTEN, stats=stats, seconds=now - last
+            )
+            last = now
+
+        try:
+            results = self._ingest(
+                [file["path"] for file in files], low_memory, written, lambda: self._cancelled(job_id)
+            )
+        except Exception as e:
+            if len(files) > 1:
+                return sum(self._ingest_batch(job_id, [file], low_memory) for file in files)
+            self.store.update_file(
+                job_id, files[0]["position"], status=FAILED, error=str(e),
+                seconds=time.perf_counter() - started
+            )
+            return 1
+        for file, stats in zip(files, results):
+            self.store.update_file(job_id, file["position"], status=DONE, stats=stats)
+        for file in files[len(results):]:
+            self.store.update_file(job_id, file["position"], status=PENDING)
+        return 0
+
+    def _ingest(self, paths, low_memory, on_document=None, should_stop=None):
+        """Ingest saved uploads as one corpus version, returning each written file's statistics
+
+        Chunk counts are per file; embedding cache and summary figures are
+        those of the whole batch ("batch_files" files).
+        """
+        processor = self.processor
+        documents = None if low_memory else processor.extract_pdfs(paths)
+        with self._write_lock:
+            if low_memory:
+                vectorstore = processor.stream_into_vector_store(
+                    paths, summarize=False, on_document=on_document, should_stop=should_stop
+                )
+            else:
+                vectorstore = processor.ingest_documents(
+                    documents, summarize=False, on_document=on_document, should_stop=should_stop
+                )
+            document_stats = processor.document_stats
+            changed = processor.changed_documents
+            batch = {
+                "batch_files": len(paths),
+                "cache_hits": processor.cache_stats["hits"],
+                "cache_misses": processor.cache_stats["misses"],
+                "summarized": 0,
+                "summary_error": None
+            }
+        if changed and self.summarize:
+            with self._summary_lock:
+                batch["summarized"], batch["summary_error"] = processor.summarize_ingested(
+                    vectorstore, changed
+                )
+        return [{**stats, **batch} for stats in document_stats]
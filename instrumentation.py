@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+from config import (
+    INSTRUMENTATION, LLM_PROMPT_COST_PER_1K, LLM_COMPLETION_COST_PER_1K, EMBEDDING_COST_PER_1K
+)
+from embedding_scheduler import estimate_tokens
+
+# Recent durations kept per span for the percentiles
+MAX_SAMPLES = 1024
+# Shared no-op span: with instrumentation off a span costs a flag check
+_NULL_SPAN = nullcontext()
+
+
+def _percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[max(1, -(-len(ordered) * pct // 100)) - 1]
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class Metrics:
+    """Process-wide stage timings and counters for ingestion and queries
+
+    Spans ("ingest.extract", "query.llm", ...) record how long each stage
+    took; counters track chunks, embeddings, tokens and cache hits. A
+    snapshot summarizes both, with an estimated API cost from the token
+    counters, and can be appended to a JSON lines file or written as a
+    Prometheus text file. Disabled metrics record nothing.
+    """
+
+    def __init__(self, enabled=INSTRUMENTATION, max_samples=MAX_SAMPLES):
+        self.enabled = enabled
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self.reset()
+
+    def span(self, name):
+        """Context manager timing one run of a stage"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def observe(self, name, seconds):
+        """Record a duration measured elsewhere, as if it had been a span"""
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = {
+                    "count": 0, "total": 0.0, "max": 0.0,
+                    "samples": deque(maxlen=self.max_samples)
+                }
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["samples"].append(seconds)
+
+    def increment(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def count_llm_tokens(self, prompt, completion, count_tokens=None):
+        """Add one LLM call's prompt and completion tokens to the counters"""
+        if not self.enabled:
+            return
+        count_tokens = count_tokens or estimate_tokens
+        self.increment("llm_calls")
+        self.increment("llm_prompt_tokens", count_tokens(prompt))
+        self.increment("llm_completion_tokens", count_tokens(completion))
+
+    def reset(self):
+        with self._lock:
+            self._spans = {}
+            self._counters = {}
+            self._since = time.time()
+
+    def snapshot(self):
+        """Span statistics, counters and estimated cost since the last reset"""
+        with self._lock:
+            spans = {name: (dict(stats), sorted(stats["samples"])) for name, stats in self._spans.items()}
+            counters = dict(self._counters)
+        return {
+            "timestamp": time.time(),
+            "since": self._since,
+            "spans": {
+                name: {
+                    "count": stats["count"],
+                    "total_seconds": stats["total"],
+                    "mean_seconds": stats["total"] / stats["count"],
+                    "p50_seconds": _percentile(samples, 50),
+                    "p95_seconds": _percentile(samples, 95),
+                    "max_seconds": stats["max"]
+                }
+                for name, (stats, samples) in sorted(spans.items())
+            },
+            "counters": dict(sorted(counters.items())),
+            "cost_usd": (
+                counters.get("llm_prompt_tokens", 0) * LLM_PROMPT_COST_PER_1K
+                + counters.get("llm_completion_tokens", 0) * LLM_COMPLETION_COST_PER_1K
+                + counters.get("embedding_tokens", 0) * EMBEDDING_COST_PER_1K
+            ) / 1000
+        }
+
+    def export_jsonl(self, path):
+        """Append the current snapshot as one JSON line"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.snapshot()) + "\n")
+
+    def export_prometheus(self, path):
+        """Write the snapshot in Prometheus text format (e.g. for node_exporter's textfile collector)"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Scrapers must never see a half-written file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def prometheus_text(self):
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP rag_stage_seconds Duration of pipeline stages",
+            "# TYPE rag_stage_seconds summary"
+        ]
+        for name, stats in snapshot["spans"].items():
+            for quantile, key in (("0.5", "p50_seconds"), ("0.95", "p95_seconds")):
+                lines.append(f'rag_stage_seconds{{stage="{name}",quantile="{quantile}"}} {stats[key]}')
+            lines.append(f'rag_stage_seconds_sum{{stage="{name}"}} {stats["total_seconds"]}')
+            lines.append(f'rag_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+        for name, value in snapshot["counters"].items():
+            metric = "rag_" + "".join(c if c.isalnum() else "_" for c in name) + "_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        lines.append("# TYPE rag_estimated_cost_usd counter")
+        lines.append(f"rag_estimated_cost_usd {snapshot['cost_usd']}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by DocumentProcessor, RAGEngine and the apps in this process
+metrics = Metrics()
@@ -0,0 +1,253 @@
+import math
+import os
+import pickle
+import re
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+# Keeps identifiers such as "BRCA1", "p53", "ImageNet-1k" or "CMIP6" intact
+TOKEN_PATTERN = re.compile(r"[a-z0-9](?:[a-z0-9_\-.]*[a-z0-9])?")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "this to was were which with".split()
+)
+
+
+def tokenize(text):
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOPWORDS
+    ]
+
+
+class LexicalIndex:
+    """BM25 inverted index over chunk texts
+
+    Postings are stored per term as two parallel uint32 arrays (chunk number,
+    term frequency), so a query touches only the postings of its own terms
+    and scores them with vectorized NumPy. Chunks can be added and removed
+    incrementally; removed chunks are tombstoned and dropped on compaction.
+    """
+
+    FILENAME = "lexical_index.pkl"
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.chunk_ids = []
+        self.positions = {}
+        self.lengths = array("I")
+        self.postings = {}
+        self.total_length = 0
+        self.removed = 0
+        self._norm = None
+        self._dead = None
+        self._scores = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.positions
+
+    def add(self, ids, texts):
+        """Index new chunks; IDs already present are ignored"""
+        with self._lock:
+            for chunk_id, text in zip(ids, texts):
+                if chunk_id in self.positions:
+                    continue
+                position = len(self.chunk_ids)
+                self.chunk_ids.append(chunk_id)
+                self.positions[chunk_id] = position
+                tokens = tokenize(text)
+                self.lengths.append(len(tokens))
+                self.total_length += len(tokens)
+                for token, count in Counter(tokens).items():
+                    posting = self.postings.get(token)
+                    if posting is None:
+                        posting = self.postings[token] = (array("I"), array("I"))
+                    posting[0].append(position)
+                    posting[1].append(count)
+            self._norm = None
+
+    def remove(self, ids):
+        with self._lock:
+            for chunk_id in ids:
+                position = self.positions.pop(chunk_id, None)
+                if position is None:
+                    continue
+                self.chunk_ids[position] = None
+                self.total_length -= self.lengths[position]
+                self.lengths[position] = 0
+                self.removed += 1
+            if self.removed > len(self.positions):
+                self.compact()
+            self._norm = None
+
+    def compact(self):
+        """Rebuild postings without tombstoned chunks"""
+        with self._lock:
+            remap = np.full(len(self.chunk_ids), -1, dtype=np.int64)
+            live = [i for i, chunk_id in enumerate(self.chunk_ids) if chunk_id is not None]
+            remap[live] = np.arange(len(live))
+            postings = {}
+            for token, (docs, freqs) in self.postings.items():
+                docs = np.frombuffer(docs, dtype=np.uint32)
+                freqs = np.frombuffer(freqs, dtype=np.uint32)
+                keep = remap[docs] >= 0
+                if keep.any():
+                    postings[token] = (
+                        array("I", remap[docs[keep]].astype(np.uint32).tobytes()),
+                        array("I", freqs[keep].tobytes())
+                    )
+            self.postings = postings
+            self.chunk_ids = [self.chunk_ids[i] for i in live]
+            self.positions = {chunk_id: i for i, chunk_id in enumerate(self.chunk_ids)}
+            self.lengths = array("I", [self.lengths[i] for i in live])
+            self.removed = 0
+            self._norm = None
+
+    def search(self, query, k=10, allowed_ids=None):
+        """Return up to k (chunk_id, bm25_score) pairs, best first"""
+        terms = set(tokenize(query))
+        with self._lock:
+            if not terms or not self.positions:
+                return []
+            num_docs = len(self.positions)
+            if self._norm is None:
+                lengths = np.frombuffer(self.lengths, dtype=np.uint32).astype(np.float32)
+                average = self.total_length / num_docs or 1.0
+                self._norm = self.k1 * (1 - self.b + self.b * lengths / average)
+                self._dead = np.array([chunk_id is None for chunk_id in self.chunk_ids], dtype=bool)
+
+            # Scratch buffer reused across queries; only touched entries are reset
+            if self._scores is None or len(self._scores) != len(self.chunk_ids):
+                self._scores = np.zeros(len(self.chunk_ids), dtype=np.float32)
+            scores = self._scores
+            touched = []
+            for term in terms:
+                posting = self.postings.get(term)
+                if posting is None:
+                    continue
+                docs = np.frombuffer(posting[0], dtype=np.uint32)
+                freqs = np.frombuffer(posting[1], dtype=np.uint32).astype(np.float32)
+                idf = math.log(1 + (num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                scores[docs] += idf * freqs * (self.k1 + 1) / (freqs + self._norm[docs])
+                touched.append(docs)
+            if not touched:
+                return []
+
+            candidates = np.unique(np.concatenate(touched))
+            candidate_scores = scores[candidates]
+            scores[candidates] = 0
+
+            keep = ~self._dead[candidates]
+            if allowed_ids is not None:
+                allowed = np.fromiter(
+                    (self.positions[i] for i in allowed_ids if i in self.positions),
+                    dtype=np.int64
+                )
+                keep &= np.isin(candidates, allowed)
+            candidates = candidates[keep]
+            candidate_scores = candidate_scores[keep]
+
+            if len(candidates) > k:
+                top = np.argpartition(-candidate_scores, k)[:k]
+                candidates, candidate_scores = candidates[top], candidate_scores[top]
+            order = np.argsort(-candidate_scores)
+            return [
+                (self.chunk_ids[i], float(score))
+                for i, score in zip(candidates[order], candidate_scores[order])
+            ]
+
+    def save(self, persist_directory):
+        path = os.path.join(persist_directory, self.FILENAME)
+        os.makedirs(persist_directory, exist_ok=True)
+        with self._lock:
+            state = {key: value for key, value in self.__dict__.items()
+                     if not key.startswith("_")}
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, persist_directory):
+        """Load the index saved in persist_directory, or an empty one"""
+        index = cls()
+        path = os.path.join(persist_directory, cls.FILENAME)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                index.__dict__.update(pickle.load(f))
+        return index
+
+    @classmethod
+    def build_from_collection(cls, collection, batch_size=5000):
+        """Build an index from every chunk already stored in a Chroma collection"""
+        index = cls()
+        offset = 0
+        while True:
+            batch = collection.get(include=["documents"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            index.add(batch["ids"], batch["documents"])
+            offset += len(batch["ids"])
+        return index
+
+    def sync_with_collection(self, collection, batch_size=5000):
+        """Index chunks the collection has but the index lacks, and drop the reverse
+
+        An ingest interrupted between a Chroma write and the index save leaves
+        chunks that re-ingestion finds in Chroma and skips. Returns whether
+        the index changed.
+        """
+        if len(self) == collection.count():
+            return False
+        stored = set()
+        offset = 0
+        while True:
+            batch = collection.get(include=[], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            stored.update(batch["ids"])
+            offset += len(batch["ids"])
+        with self._lock:
+            missing = [chunk_id for chunk_id in stored if chunk_id not in self.positions]
+            extra = [chunk_id for chunk_id in self.positions if chunk_id not in stored]
+        for i in range(0, len(missing), batch_size):
+            batch = collection.get(ids=missing[i:i + batch_size], include=["documents"])
+            self.add(batch["ids"], batch["documents"])
+        self.remove(extra)
+        return bool(missing or extra)
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse ranked ID lists: score(id) = sum over lists of 1 / (k + rank)"""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+_loaded_indexes = {}
+_loaded_lock = threading.Lock()
+
+
+def load_lexical_index(persist_directory):
+    """Shared read-side copy of a saved index, reloaded when the file changes"""
+    path = os.path.join(persist_directory, LexicalIndex.FILENAME)
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        return None
+    stamp = (info.st_ino, info.st_mtime_ns)
+    with _loaded_lock:
+        cached = _loaded_indexes.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, LexicalIndex.load(persist_directory))
+            _loaded_indexes[path] = cached
+        return cached[1]
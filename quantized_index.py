@@ -0,0 +1,484 @@
+import json
+import math
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from embedding_backends import quantize_vectors
+from corpus_manifest import corpus_version
+from config import QUANTIZED_IVF_LISTS, QUANTIZED_IVF_NPROBE, QUANTIZED_RERANK_FACTOR
+
+INDEX_DIRNAME = "quantized_index"
+# Names the published index version inside INDEX_DIRNAME
+CURRENT_FILENAME = "CURRENT"
+STALE_BUILD_SECONDS = 3600
+# Rows dequantized per matrix product; bounds the float32 scratch memory of a scan
+SCAN_BLOCK_ROWS = 4096
+# Below this many vectors a full scan is as fast as probing IVF lists
+IVF_MIN_VECTORS = 20000
+
+
+def _collection_space(collection):
+    """Distance function of a Chroma collection: "l2", "cosine" or "ip" """
+    metadata = collection.metadata or {}
+    if "hnsw:space" in metadata:
+        return metadata["hnsw:space"]
+    configuration = getattr(collection, "configuration", None) or {}
+    return (configuration.get("hnsw") or {}).get("space", "l2")
+
+
+def _exact_distances(vectors, query, space):
+    """Distances as Chroma reports them for its distance functions"""
+    if space == "l2":
+        return ((vectors - query) ** 2).sum(axis=1)
+    if space == "cosine":
+        norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query) or 1.0)
+        norms[norms == 0] = 1.0
+        return 1.0 - vectors @ query / norms
+    return 1.0 - vectors @ query
+
+
+def _half_if_close(values, rtol=1e-3):
+    """values as float16 when that keeps every one within rtol, else as float32"""
+    values = np.asarray(values, dtype=np.float32)
+    with np.errstate(over="ignore"):
+        half = values.astype(np.float16)
+    if np.all(np.abs(half.astype(np.float32) - values) <= rtol * np.abs(values)):
+        return half
+    return values
+
+
+def _kmeans(sample, n_lists, iterations=10, seed=0):
+    """Spherical k-means centroids for the IVF coarse quantizer"""
+    rng = np.random.default_rng(seed)
+    data = sample / np.maximum(np.linalg.norm(sample, axis=1, keepdims=True), 1e-12)
+    centroids = data[rng.choice(len(data), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(data @ centroids.T, axis=1)
+        for i in range(n_lists):
+            members = data[assignment == i]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[i] = centroid / max(np.linalg.norm(centroid), 1e-12)
+            else:
+                centroids[i] = data[rng.integers(len(data))]
+    return centroids
+
+
+class QuantizedIndex:
+    """Memory-mapped int8 copy of a collection's embeddings
+
+    Every vector is stored as int8 codes plus a per-row scale and norm (see
+    quantize_vectors), a quarter of the float32 size, and searched with
+    vectorized NumPy: a block-wise scan of all codes, or of the closest IVF
+    lists when the index was built with a coarse quantizer. The best
+    candidates are then re-ranked against float16 copies of the vectors,
+    kept in a separate memory-mapped file that is only paged in for those
+    rows. Scales, norms and centroids are float16 too whenever that keeps
+    them within 0.1%, so little but the codes stays resident.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.space = self.meta["space"]
+        self.corpus_version = self.meta["corpus_version"]
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode="r")
+        self.ids = load("ids.npy")
+        self.codes = load("codes.npy")
+        self.scales = load("scales.npy")
+        self.norms = load("norms.npy")
+        self.vectors = load("vectors.npy")
+        self.centroids = None
+        self.list_offsets = None
+        if self.meta["n_lists"]:
+            self.centroids = np.load(os.path.join(path, "centroids.npy"))
+            self.list_offsets = np.load(os.path.join(path, "list_offsets.npy"))
+        self._positions = None
+        self._positions_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dimensions(self):
+        return self.codes.shape[1] if self.codes.ndim == 2 else 0
+
+    def memory_usage(self):
+        """Bytes that searches keep resident vs the float32 vectors they replace
+
+        IDs and re-ranking rows are only paged in for the few rows a search
+        returns or re-ranks, so they are not counted as resident.
+        """
+        resident = self.codes.nbytes + self.scales.nbytes + self.norms.nbytes
+        if self.centroids is not None:
+            resident += self.centroids.nbytes + self.list_offsets.nbytes
+        return {"index": resident, "float32": len(self) * self.dimensions * 4}
+
+    def id_at(self, positions):
+        return [self.ids[i].decode("utf-8") for i in positions]
+
+    def positions_of(self, ids):
+        """Row numbers of the given chunk IDs (unknown IDs are skipped)"""
+        with self._positions_lock:
+            if self._positions is None:
+                self._positions = {chunk_id.decode("utf-8"): i for i, chunk_id in enumerate(self.ids)}
+        return np.fromiter(
+            (self._positions[i] for i in ids if i in self._positions), dtype=np.int64
+        )
+
+    def search(self, query_vector, k, allowed_positions=None,
+               nprobe=QUANTIZED_IVF_NPROBE, rerank_factor=QUANTIZED_RERANK_FACTOR):
+        """Return (positions, re-ranked distances) of the k nearest rows, nearest first"""
+        if not len(self) or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        query = np.asarray(query_vector, dtype=np.float32)
+
+        if allowed_positions is not None:
+            # Filtered searches scan exactly the allowed rows; probing IVF lists
+            # could miss them when the filter is narrow
+            allowed = np.unique(np.asarray(allowed_positions, dtype=np.int64))
+            blocks = [
+                allowed[i:i + SCAN_BLOCK_ROWS] for i in range(0, len(allowed), SCAN_BLOCK_ROWS)
+            ]
+        else:
+            if self.centroids is None:
+                ranges = [(0, len(self))]
+            else:
+                centroid_scores = (query / (np.linalg.norm(query) or 1.0)) @ self.centroids.T
+                probe = np.argsort(-centroid_scores)[:nprobe]
+                ranges = [(self.list_offsets[i], self.list_offsets[i + 1]) for i in sorted(probe)]
+            blocks = [
+                slice(block_start, min(block_start + SCAN_BLOCK_ROWS, stop))
+                for start, stop in ranges
+                for block_start in range(start, stop, SCAN_BLOCK_ROWS)
+            ]
+
+        num_candidates = max(k * rerank_factor, k)
+        candidates, scores = [], []
+        for block in blocks:
+            if isinstance(block, slice):
+                positions = np.arange(block.start, block.stop)
+            else:
+                positions = block
+            block_scores = self._approximate_distances(self.codes[block], positions, query)
+            if len(block_scores) > num_candidates:
+                keep = np.argpartition(block_scores, num_candidates)[:num_candidates]
+                positions, block_scores = positions[keep], block_scores[keep]
+            candidates.append(positions)
+            scores.append(block_scores)
+        if not candidates:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        candidates = np.concatenate(candidates)
+        scores = np.concatenate(scores)
+        if len(candidates) > num_candidates:
+            keep = np.argpartition(scores, num_candidates)[:num_candidates]
+            candidates = candidates[keep]
+        # Re-ranking reads only these rows from the vectors file
+        candidates = np.sort(candidates)
+        distances = _exact_distances(
+            np.asarray(self.vectors[candidates], dtype=np.float32), query, self.space
+        )
+        order = np.argsort(distances, kind="stable")[:k]
+        return candidates[order], distances[order].astype(np.float32)
+
+    def _approximate_distances(self, codes, positions, query):
+        """Distances from dequantized codes, comparable within one query"""
+        dots = (codes.astype(np.float32) @ query) * self.scales[positions].astype(np.float32)
+        if self.space == "l2":
+            return self.norms[positions].astype(np.float32) ** 2 - 2 * dots
+        if self.space == "cosine":
+            return -dots / np.maximum(self.norms[positions].astype(np.float32), 1e-12)
+        return -dots
+
+    @classmethod
+    def build(cls, collection, path, version, n_lists=QUANTIZED_IVF_LISTS, batch_size=5000):
+        """Write an index of every embedding in a Chroma collection to path
+
+        Embeddings are streamed from the collection in batches into
+        memory-mapped output files, so building never holds the float32
+        matrix in memory. The index is written to a temporary directory and
+        moved into place once complete; a published index is never modified.
+        """
+        count = collection.count()
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        ids = []
+        vectors = None
+        peak = 0.0
+        offset = 0
+        while offset < count:
+            batch = collection.get(include=["embeddings"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            embeddings = np.asarray(batch["embeddings"], dtype=np.float32)
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(
+                    os.path.join(tmp_path, "raw.npy"), mode="w+",
+                    dtype=np.float32, shape=(count, embeddings.shape[1])
+                )
+            vectors[offset:offset + len(embeddings)] = embeddings
+            peak = max(peak, float(np.abs(embeddings).max(initial=0.0)))
+            ids.extend(batch["ids"])
+            offset += len(batch["ids"])
+        count = len(ids)
+        dimensions = vectors.shape[1] if vectors is not None else 0
+
+        if n_lists == "auto":
+            n_lists = int(2 * math.sqrt(count)) if count >= IVF_MIN_VECTORS else 0
+        n_lists = min(int(n_lists), count)
+
+        # IVF lists are stored contiguously, so rows are written in list order
+        order = np.arange(count)
+        list_offsets = None
+        if n_lists:
+            rng = np.random.default_rng(0)
+            sample = vectors[np.sort(rng.choice(count, min(count, n_lists * 64), replace=False))]
+            centroids = _kmeans(np.asarray(sample), n_lists)
+            assignment = np.empty(count, dtype=np.int64)
+            for start in range(0, count, batch_size):
+                assignment[start:start + batch_size] = np.argmax(
+                    vectors[start:start + batch_size] @ centroids.T, axis=1
+                )
+            order = np.argsort(assignment, kind="stable")
+            list_offsets = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+            np.save(os.path.join(tmp_path, "centroids.npy"), _half_if_close(centroids))
+            np.save(os.path.join(tmp_path, "list_offsets.npy"), list_offsets)
+
+        width = max((len(i.encode("utf-8")) for i in ids), default=1)
+        np.save(
+            os.path.join(tmp_path, "ids.npy"),
+            np.array([ids[i].encode("utf-8") for i in order], dtype=f"S{width}")
+        )
+        # Embeddings fit float16's range; anything that does not is re-ranked as float32
+        rerank_dtype = np.float16 if peak < np.finfo(np.float16).max else np.float32
+        out = {
+            name: np.lib.format.open_memmap(
+                os.path.join(tmp_path, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape
+            )
+            for name, dtype, shape in (
+                ("vectors", rerank_dtype, (count, dimensions)),
+                ("codes", np.int8, (count, dimensions))
+            )
+        }
+        scales = np.empty(count, dtype=np.float32)
+        norms = np.empty(count, dtype=np.float32)
+        for start in range(0, count, batch_size):
+            rows = np.asarray(vectors[order[start:start + batch_size]])
+            out["vectors"][start:start + len(rows)] = rows
+            out["codes"][start:start + len(rows)] = quantize_vectors(rows, "int8")
+            row_scales = np.abs(rows).max(axis=1) / 127
+            row_scales[row_scales == 0] = 1.0 / 127
+            scales[start:start + len(rows)] = row_scales
+            norms[start:start + len(rows)] = np.linalg.norm(rows, axis=1)
+        for array in out.values():
+            array.flush()
+        np.save(os.path.join(tmp_path, "scales.npy"), _half_if_close(scales))
+        np.save(os.path.join(tmp_path, "norms.npy"), _half_if_close(norms))
+        del out, vectors
+        os.remove(os.path.join(tmp_path, "raw.npy"))
+
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "corpus_version": version,
+                "count": count,
+                "dimensions": dimensions,
+                "space": _collection_space(collection),
+                "n_lists": n_lists
+            }, f)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            # Another process published this version first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return cls(path)
+
+
+def _index_version(vectorstore):
+    """Corpus version an index must match: the manifest version, else the chunk count"""
+    persist_directory = vectorstore._persist_directory
+    return corpus_version(persist_directory) or vectorstore._collection.count()
+
+
+def current_index_path(persist_directory):
+    """Directory of the published quantized index, or None if there is none"""
+    root = os.path.join(persist_directory, INDEX_DIRNAME)
+    try:
+        with open(os.path.join(root, CURRENT_FILENAME), encoding="utf-8") as f:
+            return os.path.join(root, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+def _publish(root, name):
+    """Point CURRENT at a complete index directory with one atomic rename"""
+    tmp_path = os.path.join(root, f"{CURRENT_FILENAME}.tmp-{os.getpid()}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILENAME))
+
+
+def _prune(root, keep):
+    """Remove index versions other than `keep`, and abandoned temporary builds"""
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name == CURRENT_FILENAME or name in keep:
+            continue
+        # Another process may still be writing a recent temporary build
+        if ".tmp-" in name and time.time() - os.path.getmtime(path) < STALE_BUILD_SECONDS:
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+
+_build_lock = threading.Lock()
+
+
+def ensure_quantized_index(vectorstore):
+    """Open the published quantized index of a persisted Chroma store
+
+    Every corpus version gets its own immutable directory (v<version>). A
+    stale index is replaced by building the new version next to it and
+    atomically swapping the CURRENT pointer file, so readers only ever open
+    a complete index, and memory maps of the previous version (kept until
+    the next publish) stay valid while sessions finish with it.
+    """
+    root = os.path.join(vectorstore._persist_directory, INDEX_DIRNAME)
+    version = _index_version(vectorstore)
+    with _build_lock:
+        current = current_index_path(vectorstore._persist_directory)
+        if current and os.path.exists(os.path.join(current, "meta.json")):
+            index = QuantizedIndex(current)
+            if index.corpus_version == version:
+                return index
+
+        os.makedirs(root, exist_ok=True)
+        name = f"v{version}"
+        path = os.path.join(root, name)
+        if os.path.exists(os.path.join(path, "meta.json")):
+            index = QuantizedIndex(path)
+        else:
+            index = QuantizedIndex.build(vectorstore._collection, path, version)
+        _publish(root, name)
+        _prune(root, keep={name, os.path.basename(current or "")})
+        return index
+
+
+class QuantizedCollection:
+    """Chroma-collection lookalike that answers query() from a QuantizedIndex
+
+    RAGEngine and the corpus analyses talk to `vectorstore._collection`
+    directly; this keeps that code unchanged. Documents, metadatas and
+    filters still come from the Chroma collection (SQLite), only the vector
+    search is replaced.
+    """
+
+    def __init__(self, collection, index):
+        self.collection = collection
+        self.index = index
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas", "distances")):
+        allowed = None
+        if where:
+            allowed = self.index.positions_of(self.collection.get(where=where, include=[])["ids"])
+        fields = [field for field in ("documents", "metadatas") if field in include]
+        results = {"ids": [], "distances": [], "embeddings": [], "documents": [], "metadatas": []}
+        for query_vector in query_embeddings:
+            positions, distances, ids, stored = self._search_live(query_vector, n_results, allowed, fields)
+            results["ids"].append(ids)
+            results["distances"].append(distances.tolist())
+            if "embeddings" in include:
+                results["embeddings"].append(np.asarray(self.index.vectors[positions], dtype=np.float32))
+            by_id = {chunk_id: i for i, chunk_id in enumerate(stored["ids"])}
+            for field in fields:
+                results[field].append([stored[field][by_id[i]] for i in ids])
+        return {key: value for key, value in results.items() if key == "ids" or key in include}
+
+    def _search_live(self, query_vector, n_results, allowed, fields):
+        """Nearest indexed chunks that are still in the collection
+
+        Between a re-upload deleting a document's old chunks and the index
+        rebuild at the end of that ingest, the published index still holds
+        their IDs. Those are skipped, and the index is asked for more
+        candidates until n_results live chunks are found or it runs out.
+        Returns (positions, distances, ids, the collection's get() result).
+        """
+        k = n_results
+        while True:
+            positions, distances = self.index.search(query_vector, k, allowed)
+            ids = self.index.id_at(positions)
+            stored = self.collection.get(ids=ids, include=fields) if ids else {"ids": []}
+            live = set(stored["ids"])
+            if len(live) >= n_results or len(ids) < k:
+                break
+            k *= 2
+        keep = np.array([chunk_id in live for chunk_id in ids], dtype=bool)
+        keep &= np.cumsum(keep) <= n_results
+        return positions[keep], distances[keep], [i for i, kept in zip(ids, keep) if kept], stored
+
+    def __getattr__(self, name):
+        # get(), count(), metadata ... are served by the Chroma collection
+        return getattr(self.collection, name)
+
+
+class QuantizedVectorStore(VectorStore):
+    """Read-only vector store searching a QuantizedIndex beside a Chroma store
+
+    Ingestion still writes to Chroma (see DocumentProcessor); this store is
+    for querying with a fraction of the memory.
+    """
+
+    def __init__(self, chroma, index):
+        self.chroma = chroma
+        self.index = index
+        self._collection = QuantizedCollection(chroma._collection, index)
+        self._persist_directory = chroma._persist_directory
+
+    @property
+    def embeddings(self):
+        return self.chroma.embeddings
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, filter=None):
+        results = self._collection.query(
+            query_embeddings=[embedding], n_results=k, where=filter,
+            include=["documents", "metadatas", "distances"]
+        )
+        return [
+            (Document(page_content=text, metadata=metadata or {}), distance)
+            for text, metadata, distance in zip(
+                results["documents"][0], results["metadatas"][0], results["distances"][0]
+            )
+        ]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_by_vector_with_score(
+            self.embeddings.embed_query(query), k, filter
+        )
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        return self.chroma._select_relevance_score_fn()
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise ValueError("QuantizedVectorStore is a read-only store; ingest into Chroma")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise ValueError(
+            "QuantizedVectorStore is a read-only store; build it with ensure_quantized_index"
+        )
@@ -0,0 +1,152 @@
+import re
+from collections import Counter
+
+# Canonical section types and the headings that open them (lower case). Words
+# that are common in running text on their own ("data", "summary") are left out.
+SECTION_HEADINGS = {
+    "abstract": ("abstract",),
+    "introduction": ("introduction", "background", "related work", "literature review"),
+    "methods": (
+        "methods", "method", "methodology", "materials and methods", "data and methods",
+        "methods and data", "study area", "study design", "experimental setup",
+        "experimental design", "experiments"
+    ),
+    "results": ("results", "results and discussion"),
+    "discussion": ("discussion",),
+    "conclusion": ("conclusion", "conclusions", "concluding remarks", "summary and conclusions"),
+    "acknowledgements": (
+        "acknowledgements", "acknowledgments", "acknowledgement", "acknowledgment"
+    ),
+    "references": ("references", "bibliography", "works cited", "literature cited"),
+    "appendix": ("appendix", "appendices", "supplementary material", "supplementary information")
+}
+# Text before the first recognised heading: title, authors, affiliations
+FRONT_MATTER = "front_matter"
+SECTION_TYPES = (FRONT_MATTER,) + tuple(SECTION_HEADINGS)
+
+_HEADING_TYPES = {heading: kind for kind, headings in SECTION_HEADINGS.items() for heading in headings}
+# Optional numbering ("2", "2.1", "II.", "A)"), then a short title on its own line
+_HEADING = re.compile(
+    r"^((?:\d+(?:\.\d+)*|[IVX]+|[A-H])[.)]?\s+)?([A-Za-z][A-Za-z ,&-]{1,60}?)\s*:?$"
+)
+# Lowercase words allowed in a Title Case heading
+_MINOR_WORDS = {"a", "an", "and", "for", "in", "of", "on", "the", "to", "&"}
+_APPENDIX = re.compile(r"^(appendix|appendices)\b")
+_PAGE_NUMBER = re.compile(r"^(?:page\s*)?#+(?:\s*(?:of|/)\s*#+)?$")
+# Lines this close to the top or bottom of a page can be running headers/footers
+EDGE_LINES = 3
+
+
+def _heading_case(title):
+    """Whether a title is set in UPPER CASE or Title Case, as headings are"""
+    if title.isupper():
+        return True
+    words = title.split()
+    return words[0][0].isupper() and all(
+        word[0].isupper() or word in _MINOR_WORDS for word in words[1:]
+    )
+
+
+def _parse_heading(line):
+    """(section type, whether numbered) for a heading line, or None"""
+    match = _HEADING.match(line.strip())
+    if not match or not _heading_case(match.group(2)):
+        return None
+    title = " ".join(match.group(2).lower().split())
+    kind = "appendix" if _APPENDIX.match(title) else _HEADING_TYPES.get(title)
+    return (kind, match.group(1) is not None) if kind else None
+
+
+def heading_type(line):
+    """Section type a line opens, or None when it is not a recognised heading
+
+    Only the line itself is checked; extract_sections also requires heading
+    context (see _opens_section).
+    """
+    parsed = _parse_heading(line)
+    return parsed[0] if parsed else None
+
+
+def _opens_section(parsed, previous, kind):
+    """Whether a heading-like line really starts a section rather than ending a wrapped sentence
+
+    Numbered headings always do. Unnumbered ones need the text before them
+    to be finished: a blank line, a line ending a sentence, or the front
+    matter (title, authors and affiliations rarely end with a period).
+    """
+    if parsed is None:
+        return False
+    _, numbered = parsed
+    return (
+        numbered or kind == FRONT_MATTER or not previous
+        or previous[-1] in ".!?:"
+    )
+
+
+def _line_key(line):
+    """Line with its digits masked, so "Page 3" and "Page 4" count as the same header"""
+    return re.sub(r"\d+", "#", " ".join(line.lower().split()))
+
+
+def _edge_indices(lines):
+    """Indices of the first and last EDGE_LINES non-blank lines of a page"""
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    return set(filled[:EDGE_LINES] + filled[-EDGE_LINES:])
+
+
+def boilerplate_lines(pages, min_fraction=0.5):
+    """Keys of lines repeated at the top or bottom of many pages (running headers/footers)
+
+    A line counts when it appears near a page edge on at least min_fraction
+    of the pages (and on at least three). Section headings never count.
+    """
+    if len(pages) < 3:
+        return set()
+    counts = Counter()
+    for page in pages:
+        lines = page.splitlines()
+        counts.update({
+            _line_key(lines[i]) for i in _edge_indices(lines) if heading_type(lines[i]) is None
+        })
+    threshold = max(3, min_fraction * len(pages))
+    return {key for key, count in counts.items() if count >= threshold and key}
+
+
+def extract_sections(pages, dropped=("references",)):
+    """Clean a document's page texts and locate its sections
+
+    Running headers/footers and bare page numbers at page edges are removed,
+    and so is every section whose type is in `dropped`. Returns the cleaned
+    pages and [(section type, start, end)] spans into "".join(cleaned pages),
+    in document order. Line endings are kept, so the cleaned pages are the
+    original pages minus whole lines.
+    """
+    boilerplate = boilerplate_lines(pages)
+    dropped = set(dropped)
+    kind = FRONT_MATTER
+    previous = ""  # the line before, stripped; empty after a blank line
+    cleaned_pages = []
+    sections = []
+    offset = 0
+    for page in pages:
+        lines = page.splitlines(keepends=True)
+        edges = _edge_indices(lines)
+        kept = []
+        for i, line in enumerate(lines):
+            if i in edges:
+                key = _line_key(line)
+                if key in boilerplate or _PAGE_NUMBER.match(key):
+                    continue
+            parsed = _parse_heading(line)
+            if _opens_section(parsed, previous, kind):
+                kind = parsed[0]
+            previous = line.strip()
+            if kind in dropped:
+                continue
+            if not sections or sections[-1][0] != kind:
+                sections.append([kind, offset, offset])
+            offset += len(line)
+            sections[-1][2] = offset
+            kept.append(line)
+        cleaned_pages.append("".join(kept))
+    return cleaned_pages, [tuple(section) for section in sections if section[2] > section[1]]
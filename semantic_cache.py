@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from config import SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_MAX_ENTRIES
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Reuses answers for queries whose embeddings are nearly identical
+
+    Entries live in a scope (corpus, retrieval settings) and are tied to the
+    corpus version they were computed against: as soon as a lookup or store
+    sees a newer version for a corpus, every entry for that corpus is
+    dropped. Entries also expire after `ttl` seconds, and the least recently
+    used ones are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, ttl=SEMANTIC_CACHE_TTL,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, scope, version, query_vector):
+        """Return (response, similarity) for the closest fresh match, or None"""
+        query_vector = _normalize(query_vector)
+        with self._lock:
+            self._sync_version(scope[0], version)
+            self._expire()
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if entry["scope"] == scope
+            ]
+            if candidates:
+                matrix = np.stack([entry["vector"] for _, entry in candidates])
+                similarities = matrix @ query_vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry["response"], float(similarities[best])
+            self.misses += 1
+            return None
+
+    def store(self, scope, version, query_vector, response):
+        with self._lock:
+            self._sync_version(scope[0], version)
+            self._entries[self._next_key] = {
+                "scope": scope,
+                "vector": _normalize(query_vector),
+                "response": response,
+                "created": time.monotonic()
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, corpus=None):
+        """Drop all entries, or only those for one corpus"""
+        with self._lock:
+            self._drop(corpus)
+
+    def _sync_version(self, corpus, version):
+        if self._versions.get(corpus, version) != version:
+            self._drop(corpus)
+        self._versions[corpus] = version
+
+    def _drop(self, corpus):
+        if corpus is None:
+            self._entries.clear()
+            self._versions.clear()
+            return
+        for key in [k for k, entry in self._entries.items() if entry["scope"][0] == corpus]:
+            del self._entries[key]
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for key in [k for k, entry in self._entries.items() if entry["created"] < cutoff]:
+            del self._entries[key]
@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import threading
+import time
+
+from config import SUMMARY_STORE_PATH
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_BATCH = 500
+
+
+class SummaryStore:
+    """Persistent LLM summaries keyed by document content hash and prompt version
+
+    Each document has one summary plus, for long documents, the ordered
+    section summaries it was built from. A document that is renamed or
+    re-uploaded unchanged keeps its summaries; editing the prompts (a new
+    prompt version) makes every entry a miss.
+    """
+
+    def __init__(self, path=SUMMARY_STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "doc_hash TEXT NOT NULL, prompt_version TEXT NOT NULL, "
+            "summary TEXT NOT NULL, created REAL NOT NULL, "
+            "PRIMARY KEY (doc_hash, prompt_version))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS section_summaries ("
+            "doc_hash TEXT NOT NULL, prompt_version TEXT NOT NULL, "
+            "position INTEGER NOT NULL, summary TEXT NOT NULL, "
+            "PRIMARY KEY (doc_hash, prompt_version, position))"
+        )
+        self._conn.commit()
+
+    def get_many(self, doc_hashes, prompt_version):
+        """Return {doc_hash: summary} for the hashes that have one"""
+        doc_hashes = list(dict.fromkeys(doc_hashes))
+        found = {}
+        with self._lock:
+            for i in range(0, len(doc_hashes), _QUERY_BATCH):
+                batch = doc_hashes[i:i + _QUERY_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT doc_hash, summary FROM summaries "
+                    f"WHERE prompt_version = ? AND doc_hash IN ({placeholders})",
+                    [prompt_version, *batch]
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def get_sections(self, doc_hash, prompt_version):
+        """Ordered section summaries of a document ([] if it had a single section)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT summary FROM section_summaries "
+                "WHERE doc_hash = ? AND prompt_version = ? ORDER BY position",
+                (doc_hash, prompt_version)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def put(self, doc_hash, prompt_version, summary, sections=()):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM section_summaries WHERE doc_hash = ? AND prompt_version = ?",
+                (doc_hash, prompt_version)
+            )
+            self._conn.executemany(
+                "INSERT INTO section_summaries (doc_hash, prompt_version, position, summary) "
+                "VALUES (?, ?, ?, ?)",
+                [(doc_hash, prompt_version, i, text) for i, text in enumerate(sections)]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (doc_hash, prompt_version, summary, created) "
+                "VALUES (?, ?, ?, ?)",
+                (doc_hash, prompt_version, summary, time.time())
+            )
+            self._conn.commit()
+
+    def invalidate(self, prompt_version=None):
+        """Drop summaries for one prompt version, or everything when None"""
+        with self._lock:
+            for table in ("summaries", "section_summaries"):
+                if prompt_version is None:
+                    self._conn.execute(f"DELETE FROM {table}")
+                else:
+                    self._conn.execute(
+                        f"DELETE FROM {table} WHERE prompt_version = ?", (prompt_version,)
+                    )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
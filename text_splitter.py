@@ -0,0 +1,175 @@
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from operator import sub
+
+from config import CHUNK_SIZE, CHUNK_OVERLAP
+
+DEFAULT_SEPARATORS = ("\n\n", "\n", " ", "")
+# Characters of a chunk matched before searching for all of it (see split_offsets)
+PREFIX_CHARS = 16
+
+
+def _strip(text, start, end):
+    """Bounds of text[start:end].strip() without building the string"""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+class OffsetTextSplitter:
+    """Single-pass, offset-based equivalent of LangChain's RecursiveCharacterTextSplitter
+
+    Produces exactly the chunks (and start_index values) of
+    RecursiveCharacterTextSplitter(chunk_size, chunk_overlap,
+    add_start_index=True) with its default settings (separators kept at the
+    start of each piece, whitespace stripped, length measured in characters),
+    but works on (start, end) offsets into the source text: pieces are
+    located with one str.split per separator (only their lengths are kept)
+    and merged by bisecting their boundaries, and no chunk strings are
+    built. benchmark_splitter.py checks the output against LangChain's and
+    compares their speed.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                 separators=DEFAULT_SEPARATORS):
+        if chunk_overlap > chunk_size:
+            raise ValueError(
+                f"Got a larger chunk overlap ({chunk_overlap}) than chunk size "
+                f"({chunk_size}), should be smaller."
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = tuple(separators)
+
+    def split_offsets(self, text):
+        """(start, end) of every chunk; text[start:end] is the chunk"""
+        spans = []
+        self._split(text, 0, len(text), 0, spans)
+        # LangChain reports each chunk's start as the first match of its text
+        # at or after (previous start + previous length - overlap); that is the
+        # chunk's own position unless the same text also occurs just before it
+        # (only in highly repetitive text), so a bounded search settles it.
+        # The chunk cannot occur earlier unless its first few characters do,
+        # so those are looked for first and the whole chunk only on a hit.
+        offsets = []
+        previous_start, previous_length = 0, 0
+        for start, end in spans:
+            search_from = max(0, previous_start + previous_length - self.chunk_overlap)
+            if search_from < start:
+                prefix = min(PREFIX_CHARS, end - start)
+                if text.find(text[start:start + prefix], search_from, start + prefix - 1) != -1:
+                    found = text.find(text[start:end], search_from, end - 1)
+                    if found != -1:
+                        start, end = found, found + end - start
+            offsets.append((start, end))
+            previous_start, previous_length = start, end - start
+        return offsets
+
+    def split_text(self, text):
+        return [text[start:end] for start, end in self.split_offsets(text)]
+
+    def _split(self, text, start, end, level, out):
+        """Recursively split text[start:end], appending chunk spans to out"""
+        separators = self.separators
+        separator = separators[-1]
+        next_level = len(separators)
+        for i in range(level, len(separators)):
+            if separators[i] == "":
+                separator = ""
+                next_level = len(separators)
+                break
+            if text.find(separators[i], start, end) != -1:
+                separator = separators[i]
+                next_level = i + 1
+                break
+
+        if separator == "":
+            # Every character is a piece of its own
+            self._merge_characters(text, start, end, out)
+            return
+
+        bounds = self._piece_bounds(text, start, end, separator)
+        if max(map(sub, bounds[1:], bounds[:-1]), default=0) < self.chunk_size:
+            self._merge(text, bounds, 0, len(bounds) - 1, out)
+            return
+        # Pieces of chunk_size or more are split further; the runs between them are merged
+        run = 0
+        for i in range(len(bounds) - 1):
+            piece_start, piece_end = bounds[i], bounds[i + 1]
+            if piece_end - piece_start < self.chunk_size:
+                continue
+            if i > run:
+                self._merge(text, bounds, run, i, out)
+            if next_level >= len(separators):
+                out.append((piece_start, piece_end))
+            else:
+                self._split(text, piece_start, piece_end, next_level, out)
+            run = i + 1
+        if len(bounds) - 1 > run:
+            self._merge(text, bounds, run, len(bounds) - 1, out)
+
+    @staticmethod
+    def _piece_bounds(text, start, end, separator):
+        """Boundaries of the pieces of text[start:end], each starting with the separator
+
+        str.split finds the separators and only the part lengths are used,
+        so no Python code runs per piece: the kth boundary is the start of
+        the kth separator. An empty leading piece is dropped.
+        """
+        width = len(separator)
+        bounds = list(accumulate(
+            map(width.__add__, map(len, text[start:end].split(separator))),
+            initial=start - width
+        ))
+        bounds[0], bounds[-1] = start, end
+        if len(bounds) > 2 and bounds[1] == start:
+            del bounds[0]
+        return bounds
+
+    def _merge(self, text, bounds, lo, hi, out):
+        """Greedily combine pieces lo..hi-1 into chunks, keeping up to chunk_overlap
+
+        Piece i spans bounds[i]:bounds[i + 1] and every piece is shorter than
+        chunk_size. The pieces are contiguous, so a run's length is the
+        distance between its bounds and each chunk's end, and the overlap
+        kept from it, are found by bisection rather than piece by piece.
+        """
+        chunk_size = self.chunk_size
+        chunk_overlap = self.chunk_overlap
+        first = lo  # index of the oldest piece in the current chunk
+        while True:
+            # First piece that no longer fits after bounds[first]
+            index = bisect_right(bounds, bounds[first] + chunk_size, first + 1, hi + 1) - 1
+            if index >= hi:
+                break
+            self._emit(text, bounds[first], bounds[index], out)
+            # Drop the oldest pieces until at most chunk_overlap remains and piece index fits
+            first = max(
+                bisect_left(bounds, bounds[index] - chunk_overlap, first, index),
+                bisect_left(bounds, bounds[index + 1] - chunk_size, first, index)
+            )
+        if first < hi:
+            self._emit(text, bounds[first], bounds[hi], out)
+
+    def _merge_characters(self, text, start, end, out):
+        """_merge for one-character pieces, in closed form"""
+        chunk_size = self.chunk_size
+        step = chunk_size - self.chunk_overlap
+        if step <= 0:
+            self._merge(text, list(range(start, end + 1)), 0, end - start, out)
+            return
+        window = start
+        # A full window is emitted whenever a character follows it
+        while window + chunk_size < end:
+            self._emit(text, window, window + chunk_size, out)
+            window += step
+        if window < end:
+            self._emit(text, window, end, out)
+
+    @staticmethod
+    def _emit(text, start, end, out):
+        start, end = _strip(text, start, end)
+        if end > start:
+            out.append((start, end))